@@ -0,0 +1,178 @@
+"""
+Admission control and load shedding
+
+Requests are admitted while fewer than a fixed number are in progress; beyond
+that they wait in a bounded FIFO queue for at most a deadline. Optionally,
+each client is also rate limited by a token bucket. Requests that cannot be
+admitted are rejected straight away (429 for rate limits, 503 when the server
+is saturated) with a Retry-After header, so the latency of admitted requests
+stays bounded instead of growing with the backlog.
+
+Limits are per process and must only be used from the event loop.
+"""
+from collections import OrderedDict, deque
+from typing import Collection, Optional
+import asyncio
+import json
+import math
+import time
+
+from metrics import Counter, Histogram
+
+class TokenBuckets:
+    """A token bucket per client, refilled at rate tokens per second up to burst.
+
+    At most max_clients buckets are kept; the least recently seen client's
+    bucket is dropped first, which refills it.
+    """
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_clients = max(1, max_clients)
+        # client -> [tokens, time of last refill]
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    def take(self, client: str, now: Optional[float] = None) -> float:
+        """Take a token for client: 0 if one was available, else the seconds until there is one"""
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = [self.burst, now]
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+class ConcurrencyLimiter:
+    """At most limit holders at a time, with up to max_queue more waiting at most timeout seconds"""
+    def __init__(self, limit: int, max_queue: int, timeout: float):
+        self.limit = max(1, limit)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self.active = 0
+        self._waiters: deque = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> Optional[str]:
+        """None once admitted (release() must follow), or why the caller was turned away:
+        "queue_full" or "queue_timeout"
+        """
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return None
+        if len(self._waiters) >= self.max_queue:
+            return "queue_full"
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the deadline passed
+                return None
+            self._discard(waiter)
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._discard(waiter)
+            raise
+        return None
+
+    def _discard(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self):
+        """Hand the slot to the longest-waiting caller, or free it"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+class AdmissionMiddleware:
+    """ASGI middleware applying a ConcurrencyLimiter and/or per-client TokenBuckets to HTTP requests.
+
+    Clients are identified by the client_header request header when it is
+    given and present, otherwise by their address. Paths in exempt_paths and
+    non-HTTP connections bypass both limits. Rejections are counted in shed by
+    reason ("rate_limited", "queue_full" or "queue_timeout"), and the time
+    admitted requests spent queued is observed in queue_wait.
+    """
+    def __init__(self, app, shed: Counter, limiter: Optional[ConcurrencyLimiter] = None,
+                 buckets: Optional[TokenBuckets] = None, exempt_paths: Collection[str] = (),
+                 client_header: str = "", queue_wait: Optional[Histogram] = None):
+        self.app = app
+        self.shed = shed
+        self.limiter = limiter
+        self.buckets = buckets
+        self.exempt_paths = frozenset(exempt_paths)
+        self.client_header = client_header.lower().encode("latin-1")
+        self.queue_wait = queue_wait
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        if self.buckets is not None:
+            retry_after = self.buckets.take(self._client(scope))
+            if retry_after:
+                self.shed.inc("rate_limited")
+                await self._reject(send, 429, "Rate limit exceeded", retry_after)
+                return
+        if self.limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        reason = await self.limiter.acquire()
+        if reason is not None:
+            self.shed.inc(reason)
+            await self._reject(send, 503, "Server is busy, please retry", self.limiter.timeout)
+            return
+        if self.queue_wait is not None:
+            self.queue_wait.observe(time.perf_counter() - start)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.release()
+
+    def _client(self, scope) -> str:
+        if self.client_header:
+            for name, value in scope["headers"]:
+                if name == self.client_header:
+                    return value.decode("latin-1")
+        client = scope.get("client")
+        return client[0] if client else ""
+
+    @staticmethod
+    async def _reject(send, status: int, detail: str, retry_after: float):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,188 @@
+"""
+Benchmark and load-test suite for the assessment API
+
+Two parts:
+- micro: per-call timings of the calculate_*/generate_* functions, the table
+  lookups and plan serialization
+- load: an in-process load generator that drives POST /assess through httpx's
+  ASGI transport with a synthetic population covering every goal, activity
+  level and dietary preference, reporting throughput and p50/p95/p99 latency
+
+Results can be saved as a baseline and later runs compared against it; the
+script exits non-zero when any metric is worse than the baseline by more than
+--max-regression.
+
+Usage:
+    python benchmark.py --save-baseline benchmark_baseline.json
+    python benchmark.py --baseline benchmark_baseline.json --max-regression 0.25
+    python benchmark.py load --requests 5000 --concurrency 64
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import statistics
+import sys
+import time
+import timeit
+from typing import Callable, Dict, List
+
+import httpx
+
+import main
+
+def generate_population(size: int, seed: int = 42) -> List[dict]:
+    """Synthetic /assess request bodies, cycling through every gender, activity level, goal and diet"""
+    rng = random.Random(seed)
+    combinations = list(itertools.product(("male", "female", "other"), main.ACTIVITY_LEVELS, main.GOALS,
+                                          main.DIETARY_PREFERENCES))
+    population = []
+    for i in range(size):
+        gender, activity_level, goal, dietary_preference = combinations[i % len(combinations)]
+        population.append({
+            "name": f"Synthetic User {i}",
+            "age": rng.randint(18, 85),
+            "gender": gender,
+            "height": round(rng.uniform(145, 205), 1),
+            "weight": round(rng.uniform(40, 150), 1),
+            "activity_level": activity_level,
+            "goal": goal,
+            "dietary_preference": dietary_preference,
+            "medical_conditions": rng.choice([[], [], ["asthma"], ["type 2 diabetes", "hypertension"]])
+        })
+    return population
+
+def time_call(func: Callable[[], object], repeat: int) -> float:
+    """Median time per call in microseconds"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    runs = timer.repeat(repeat=repeat, number=number)
+    return statistics.median(runs) / number * 1e6
+
+def run_micro(repeat: int) -> Dict[str, float]:
+    body = generate_population(1)[0]
+    user = main.UserHealthInfo(**body)
+    metrics = main.calculate_health_metrics(user)
+    bmi = metrics["bmi"]
+    daily_calories = metrics["daily_calories"]
+    macros = metrics["macros"]
+    assessment = main.build_assessment_content(user, metrics)
+    plan = main.build_personalized_plan(user, metrics)
+    cohort = [main.UserHealthInfo(**record) for record in generate_population(1000)]
+
+    cases = {
+        "calculate_bmi": lambda: main.calculate_bmi(user.weight, user.height),
+        "get_bmi_category": lambda: main.get_bmi_category(bmi),
+        "calculate_bmr": lambda: main.calculate_bmr(user.weight, user.height, user.age, user.gender),
+        "calculate_daily_calories": lambda: main.calculate_daily_calories(metrics["bmr"], user.activity_level, user.goal),
+        "calculate_macros": lambda: main.calculate_macros(daily_calories, user.goal),
+        "calculate_ideal_weight": lambda: main.calculate_ideal_weight(user.height, user.gender),
+        "calculate_health_metrics": lambda: main.calculate_health_metrics(user),
+        "calculate_metrics_batch_per_record": lambda: main.calculate_metrics_batch(cohort),
+        "assess_health_risks": lambda: main.assess_health_risks(bmi, user.age, user.medical_conditions),
+        "lookup_health_risks": lambda: main.lookup_health_risks(bmi, user.age, user.medical_conditions),
+        "generate_recommendations": lambda: main.generate_recommendations(user, bmi, assessment["bmi_category"]),
+        "lookup_recommendations": lambda: main.lookup_recommendations(user, bmi),
+        "generate_workout_plan": lambda: main.generate_workout_plan(user, assessment["bmi_category"]),
+        "generate_meal_suggestions": lambda: main.generate_meal_suggestions(daily_calories, macros, user.dietary_preference),
+        "render_meal_suggestions": lambda: main.render_meal_suggestions(user, daily_calories, macros),
+        "generate_lifestyle_tips": lambda: main.generate_lifestyle_tips(user),
+        "generate_weekly_goals": lambda: main.generate_weekly_goals(user, daily_calories),
+        "build_personalized_plan": lambda: main.build_personalized_plan(user, metrics),
+        "personalized_plan_model_dump_json": lambda: plan.model_dump_json(),
+        "personalized_plan_dump_json": lambda: main.dump_json(plan.model_dump(mode="json")),
+        "render_plan_json": lambda: main.render_plan_json(user, assessment),
+    }
+    results = {}
+    for name, func in cases.items():
+        results[name] = time_call(func, repeat)
+    results["calculate_metrics_batch_per_record"] /= len(cohort)
+    return {f"{name}_us": round(value, 3) for name, value in results.items()}
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+async def drive_load(requests: int, concurrency: int, population_size: int) -> Dict[str, float]:
+    population = generate_population(population_size)
+    latencies: List[float] = []
+    errors = 0
+    next_request = iter(range(requests))
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://benchmark") as client:
+        async def worker():
+            nonlocal errors
+            for i in next_request:
+                started = time.perf_counter()
+                response = await client.post("/assess", json=population[i % len(population)])
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "errors": errors
+    }
+
+def find_regressions(results: dict, baseline: dict, max_regression: float) -> List[str]:
+    """Metrics worse than the baseline by more than max_regression (throughput: lower is worse)"""
+    regressions = []
+    for section, metrics in baseline.items():
+        for name, expected in metrics.items():
+            actual = results.get(section, {}).get(name)
+            if actual is None:
+                continue
+            if name == "errors":
+                if actual > expected:
+                    regressions.append(f"{section}.{name}: {actual} > baseline {expected}")
+                continue
+            if not expected:
+                continue
+            change = (expected - actual) / expected if name.endswith("_rps") else (actual - expected) / expected
+            if change > max_regression:
+                regressions.append(f"{section}.{name}: {actual} vs baseline {expected} ({change:+.0%} worse)")
+    return regressions
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark the health assessment API")
+    parser.add_argument("suite", nargs="?", choices=["all", "micro", "load"], default="all")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing repeats per micro-benchmark")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests sent by the load generator")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent load generator clients")
+    parser.add_argument("--population", type=int, default=500,
+                        help="Distinct synthetic users (fewer means more result cache hits)")
+    parser.add_argument("--baseline", help="Compare against this baseline JSON file")
+    parser.add_argument("--save-baseline", help="Write results to this baseline JSON file")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="Allowed fractional slowdown versus the baseline before failing")
+    args = parser.parse_args()
+
+    results = {}
+    if args.suite in ("all", "micro"):
+        results["micro"] = run_micro(args.repeat)
+    if args.suite in ("all", "load"):
+        results["load"] = asyncio.run(drive_load(args.requests, args.concurrency, args.population))
+    print(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,222 @@
+"""
+Append-only columnar store for population analytics
+
+Each column lives in its own raw little-endian file that is memory-mapped for
+queries, so aggregations over millions of rows read only the columns they use
+and never need the whole population in RAM. Rows are appended by a background
+thread; the committed row count is kept in meta.json and only advances after
+every column file has been written, so a crash mid-append loses at most the
+rows of that append.
+"""
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import json
+import os
+
+import numpy as np
+
+_STOP = object()
+
+class CohortStore:
+    """Columnar store with one memory-mapped file per column.
+
+    columns maps column names to NumPy dtype strings. record() queues a single
+    item, turned into a row tuple (in column order) by parse_row on the writer
+    thread; append() queues whole columns at once. Both return False and count
+    a drop instead of blocking when max_queue items are already waiting.
+    """
+    def __init__(self, directory: str, columns: Dict[str, str], parse_row: Callable[[Any], tuple] = tuple,
+                 max_queue: int = 10000):
+        self.directory = directory
+        self.columns = {name: np.dtype(dtype) for name, dtype in columns.items()}
+        self.parse_row = parse_row
+        self._queue: Queue = Queue(maxsize=max(1, max_queue))
+        self._lock = Lock()
+        self._writer: Optional[Thread] = None
+        self._rows = 0
+        self.dropped = 0
+        self.appends = 0
+        self.write_errors = 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.col")
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    def open(self):
+        """Create or reopen the store, discarding any partially appended rows"""
+        os.makedirs(self.directory, exist_ok=True)
+        schema = {name: dtype.str for name, dtype in self.columns.items()}
+        if os.path.exists(self._meta_path()):
+            with open(self._meta_path()) as f:
+                meta = json.load(f)
+            if meta["columns"] != schema:
+                raise ValueError(f"Cohort store at {self.directory} has columns {meta['columns']}, expected {schema}")
+            rows = meta["rows"]
+        else:
+            rows = 0
+        for name, dtype in self.columns.items():
+            with open(self._path(name), "ab") as f:
+                f.truncate(rows * dtype.itemsize)
+        self._rows = rows
+        self._write_meta()
+
+    def _write_meta(self):
+        temporary = self._meta_path() + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump({"rows": self._rows, "columns": {name: dtype.str for name, dtype in self.columns.items()}}, f)
+        os.replace(temporary, self._meta_path())
+
+    def start(self):
+        if self._writer is not None:
+            return
+        self.open()
+        self._writer = Thread(target=self._write_loop, name="cohort-writer", daemon=True)
+        self._writer.start()
+
+    def stop(self):
+        """Write everything still queued, then stop the writer thread"""
+        if self._writer is None:
+            return
+        self._queue.put(_STOP)
+        self._writer.join()
+        self._writer = None
+
+    def _enqueue(self, item) -> bool:
+        try:
+            self._queue.put_nowait(item)
+        except Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def record(self, item: Any) -> bool:
+        """Queue one row, as an item for parse_row"""
+        return self._enqueue(("row", item))
+
+    def append(self, columns: Dict[str, np.ndarray]) -> bool:
+        """Queue many rows given as equal-length arrays, one per column"""
+        return self._enqueue(("columns", {name: np.asarray(columns[name], dtype=dtype)
+                                          for name, dtype in self.columns.items()}))
+
+    def flush(self):
+        """Block until every row queued so far has been written"""
+        self._queue.join()
+
+    def _write_loop(self):
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except Empty:
+                    break
+            stopping = _STOP in batch
+            try:
+                self._write([item for item in batch if item is not _STOP])
+            except Exception:
+                self.write_errors += 1
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, items: List[tuple]):
+        rows = [self.parse_row(payload) for kind, payload in items if kind == "row"]
+        parts: Dict[str, List[np.ndarray]] = {name: [] for name in self.columns}
+        if rows:
+            for (name, dtype), values in zip(self.columns.items(), zip(*rows)):
+                parts[name].append(np.array(values, dtype=dtype))
+        for kind, payload in items:
+            if kind == "columns":
+                for name in self.columns:
+                    parts[name].append(payload[name])
+        added = sum(len(part) for part in parts[next(iter(self.columns))])
+        if not added:
+            return
+        for name, arrays in parts.items():
+            with open(self._path(name), "r+b") as f:
+                # Overwrite whatever a failed earlier append left past the committed rows
+                f.seek(self._rows * self.columns[name].itemsize)
+                f.truncate()
+                for array in arrays:
+                    f.write(array.tobytes())
+        with self._lock:
+            self._rows += added
+            self._write_meta()
+        self.appends += 1
+
+    @property
+    def rows(self) -> int:
+        with self._lock:
+            return self._rows
+
+    def column(self, name: str, rows: Optional[int] = None) -> np.ndarray:
+        """Read-only memory map of the first rows (default: all committed) rows of a column"""
+        rows = self.rows if rows is None else rows
+        dtype = self.columns[name]
+        if rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self._path(name), dtype=dtype, mode="r", shape=(rows,))
+
+    def aggregate(self, group_by: Sequence[str], metrics: Sequence[str], cardinality: Dict[str, int],
+                  bins: Optional[Dict[str, Sequence[float]]] = None, chunk_rows: int = 1 << 20) -> List[dict]:
+        """Count, mean, standard deviation, min and max of metrics per group, over all committed rows.
+
+        Groups are combinations of group_by column values: integer codes below
+        cardinality[name], or for columns in bins the index of the bin
+        (np.searchsorted with side="left" on the bin edges). Rows are processed
+        chunk_rows at a time. Returns one entry per non-empty group with its
+        key as a tuple of codes, in ascending key order.
+        """
+        bins = bins or {}
+        sizes = [len(bins[name]) + 1 if name in bins else cardinality[name] for name in group_by]
+        groups = int(np.prod(sizes, dtype=np.int64))
+        rows = self.rows
+        counts = np.zeros(groups, dtype=np.int64)
+        sums = {name: np.zeros(groups) for name in metrics}
+        squares = {name: np.zeros(groups) for name in metrics}
+        minimums = {name: np.full(groups, np.inf) for name in metrics}
+        maximums = {name: np.full(groups, -np.inf) for name in metrics}
+        keys = {name: self.column(name, rows) for name in group_by}
+        values = {name: self.column(name, rows) for name in metrics}
+
+        for start in range(0, rows, chunk_rows):
+            stop = min(start + chunk_rows, rows)
+            key = np.zeros(stop - start, dtype=np.int64)
+            for name, size in zip(group_by, sizes):
+                codes = keys[name][start:stop]
+                if name in bins:
+                    codes = np.searchsorted(bins[name], codes, side="left")
+                key = key * size + codes
+            counts += np.bincount(key, minlength=groups)
+            for name in metrics:
+                chunk = np.asarray(values[name][start:stop], dtype=np.float64)
+                sums[name] += np.bincount(key, weights=chunk, minlength=groups)
+                squares[name] += np.bincount(key, weights=chunk * chunk, minlength=groups)
+                np.minimum.at(minimums[name], key, chunk)
+                np.maximum.at(maximums[name], key, chunk)
+
+        results = []
+        for group in np.flatnonzero(counts).tolist():
+            count = int(counts[group])
+            key = tuple(int(code) for code in np.unravel_index(group, sizes)) if sizes else ()
+            entry = {"key": key, "count": count}
+            for name in metrics:
+                mean = sums[name][group] / count
+                variance = max(squares[name][group] / count - mean * mean, 0.0)
+                entry[name] = {"mean": float(mean), "std": float(np.sqrt(variance)),
+                               "min": float(minimums[name][group]), "max": float(maximums[name][group])}
+            results.append(entry)
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "rows": self.rows,
+            "queued": self._queue.qsize(),
+            "dropped": self.dropped,
+            "appends": self.appends,
+            "write_errors": self.write_errors
+        }
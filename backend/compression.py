@@ -0,0 +1,120 @@
+"""
+Response compression from pre-compressed fragments
+
+Responses are assembled from byte fragments, many of them the same for every
+response. Each registered static fragment is deflated once, on its own, and
+ends on a byte boundary (a sync flush), so a gzip body is built by splicing
+those segments between freshly deflated dynamic parts and closing the stream
+with one final empty block, a CRC-32 and the length. Only the dynamic parts are
+compressed per response.
+
+Brotli streams cannot be spliced, so brotli bodies are compressed whole; the
+caller can cache them by content hash. Brotli is optional and only offered when
+the brotli package is installed.
+"""
+from typing import Dict, Iterable, List, Optional
+import struct
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Magic, deflate, no flags, no modification time, no extra flags, unknown OS
+_GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+# A final, empty fixed-Huffman block: ends a deflate stream of sync-flushed segments
+_FINAL_BLOCK = b"\x03\x00"
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """Codings of an Accept-Encoding header with their q-values"""
+    codings = {}
+    for item in (header or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding.strip().lower()] = q
+    return codings
+
+class FragmentCompressor:
+    """Gzip and brotli encoding of bodies given as lists of fragments.
+
+    Fragments registered with register() of at least min_fragment_bytes are
+    pre-compressed; smaller ones and unregistered parts are compressed per
+    body, merged with their neighbours.
+    """
+    def __init__(self, level: int = 6, brotli_quality: int = 5, min_fragment_bytes: int = 128):
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.min_fragment_bytes = min_fragment_bytes
+        self._segments: Dict[bytes, bytes] = {}
+
+    @property
+    def encodings(self) -> tuple:
+        """Supported codings, most preferred first"""
+        return ("br", "gzip") if brotli is not None else ("gzip",)
+
+    def negotiate(self, accept_encoding: Optional[str]) -> Optional[str]:
+        """The supported coding the client accepts with the highest q-value, or None for identity"""
+        accepted = parse_accept_encoding(accept_encoding)
+        best = None
+        for coding in self.encodings:
+            q = accepted.get(coding, accepted.get("*", 0.0))
+            if q > 0 and (best is None or q > best[1]):
+                best = (coding, q)
+        return best[0] if best else None
+
+    def _deflate(self, data: bytes) -> bytes:
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def register(self, fragment: bytes):
+        if len(fragment) >= self.min_fragment_bytes and fragment not in self._segments:
+            self._segments[fragment] = self._deflate(fragment)
+
+    def gzip(self, parts: Iterable[bytes]) -> bytes:
+        segments: List[bytes] = [_GZIP_HEADER]
+        pending: List[bytes] = []
+        crc = 0
+        size = 0
+        for part in parts:
+            crc = zlib.crc32(part, crc)
+            size += len(part)
+            segment = self._segments.get(part)
+            if segment is None:
+                pending.append(part)
+                continue
+            if pending:
+                segments.append(self._deflate(b"".join(pending)))
+                pending = []
+            segments.append(segment)
+        if pending:
+            segments.append(self._deflate(b"".join(pending)))
+        segments.append(_FINAL_BLOCK)
+        segments.append(struct.pack("<II", crc, size & 0xFFFFFFFF))
+        return b"".join(segments)
+
+    def brotli(self, body: bytes) -> bytes:
+        return brotli.compress(body, mode=brotli.MODE_TEXT, quality=self.brotli_quality)
+
+    def encode(self, coding: str, parts: List[bytes]) -> bytes:
+        if coding == "gzip":
+            return self.gzip(parts)
+        if coding == "br":
+            return self.brotli(b"".join(parts))
+        raise ValueError(f"Unsupported coding '{coding}'")
+
+    def stats(self) -> dict:
+        return {
+            "fragments": len(self._segments),
+            "fragment_bytes": sum(map(len, self._segments)),
+            "compressed_bytes": sum(map(len, self._segments.values()))
+        }
@@ -0,0 +1,164 @@
+"""
+Persistent assessment history in SQLite
+
+Assessments are queued in memory and written by a background thread in
+batched transactions, so the request that produced an assessment never waits
+on disk. The database runs in WAL mode, so history reads are not blocked by
+the writer.
+"""
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from typing import List, Optional, Tuple
+import json
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assessments (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    recorded_at REAL NOT NULL,
+    weight REAL NOT NULL,
+    height REAL NOT NULL,
+    bmi REAL NOT NULL,
+    bmr REAL NOT NULL,
+    daily_calories REAL NOT NULL,
+    assessment TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS assessments_by_user ON assessments (user_id, id);
+"""
+
+# Columns that can be charted with trend()
+TREND_METRICS = ("bmi", "weight", "bmr", "daily_calories")
+
+_STOP = object()
+
+class HistoryStore:
+    """Write-behind store of serialized HealthAssessments keyed by user id.
+
+    record() only appends to a queue of at most max_queue entries; when the
+    queue is full the entry is dropped and counted rather than blocking the
+    caller. The writer thread drains up to batch_size queued entries per
+    transaction, so batches grow with load.
+    """
+    def __init__(self, path: str, max_queue: int = 10000, batch_size: int = 500):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self._queue: Queue = Queue(maxsize=max(1, max_queue))
+        self._read_lock = Lock()
+        self._reader: Optional[sqlite3.Connection] = None
+        self._writer: Optional[Thread] = None
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+        self.transactions = 0
+        self.write_errors = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def start(self):
+        if self._writer is not None:
+            return
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        self._reader = conn
+        self._writer = Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+
+    def stop(self):
+        """Write everything still queued, then stop the writer thread"""
+        if self._writer is None:
+            return
+        self._queue.put(_STOP)
+        self._writer.join()
+        self._writer = None
+        self._reader.close()
+        self._reader = None
+
+    def record(self, user_id: str, weight: float, height: float, assessment: bytes) -> bool:
+        """Queue a serialized HealthAssessment; returns False if it was dropped because the queue is full"""
+        try:
+            self._queue.put_nowait((user_id, time.time(), weight, height, assessment))
+        except Full:
+            self.dropped += 1
+            return False
+        self.recorded += 1
+        return True
+
+    def flush(self):
+        """Block until every entry queued so far has been written"""
+        self._queue.join()
+
+    def _write_loop(self):
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except Empty:
+                    break
+            if _STOP in batch:
+                stopping = True
+            entries = [entry for entry in batch if entry is not _STOP]
+            try:
+                if entries:
+                    self._write(conn, entries)
+            except Exception:
+                self.write_errors += 1
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        conn.close()
+
+    def _write(self, conn: sqlite3.Connection, entries: List[tuple]):
+        rows = []
+        for user_id, recorded_at, weight, height, assessment in entries:
+            # Parsed here rather than on the request path
+            content = json.loads(assessment)
+            rows.append((user_id, recorded_at, weight, height, content["bmi"], content["bmr"],
+                         content["daily_calories"], assessment.decode("utf-8")))
+        with conn:
+            conn.executemany(
+                "INSERT INTO assessments (user_id, recorded_at, weight, height, bmi, bmr, daily_calories, assessment) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.written += len(rows)
+        self.transactions += 1
+
+    def _query(self, sql: str, params: tuple) -> List[tuple]:
+        with self._read_lock:
+            return self._reader.execute(sql, params).fetchall()
+
+    def history(self, user_id: str, limit: int, before: Optional[int] = None) -> List[Tuple[int, float, float, float, str]]:
+        """(id, recorded_at, weight, height, assessment JSON) rows, newest first, with id below before"""
+        return self._query(
+            "SELECT id, recorded_at, weight, height, assessment FROM assessments "
+            "WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+            (user_id, before if before is not None else 2 ** 63 - 1, limit))
+
+    def trend(self, user_id: str, metric: str, limit: int, after: Optional[int] = None,
+              since: Optional[float] = None, until: Optional[float] = None) -> List[Tuple[int, float, float]]:
+        """(id, recorded_at, value) rows of one TREND_METRICS column, oldest first, with id above after"""
+        if metric not in TREND_METRICS:
+            raise ValueError(f"Unknown metric '{metric}'; expected one of {', '.join(TREND_METRICS)}")
+        return self._query(
+            f"SELECT id, recorded_at, {metric} FROM assessments "
+            "WHERE user_id = ? AND id > ? AND recorded_at >= ? AND recorded_at <= ? ORDER BY id LIMIT ?",
+            (user_id, after or 0, since if since is not None else float("-inf"),
+             until if until is not None else float("inf"), limit))
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "max_queue": self._queue.maxsize,
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "written": self.written,
+            "transactions": self.transactions,
+            "write_errors": self.write_errors
+        }
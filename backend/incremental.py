@@ -0,0 +1,99 @@
+"""
+Incremental recomputation over a dependency graph
+
+A DependencyGraph names each derived value together with the values it is
+calculated from. An IncrementalSession holds one set of inputs and everything
+derived from them; when some inputs change, only the values downstream of them
+are recalculated, and a value that comes out the same as before stops the
+change from propagating further. A value whose function raises is treated as
+unavailable, along with everything derived from it, and the session carries on.
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+_MISSING = object()
+
+class DependencyGraph:
+    """Derived values as name -> (names of the values they depend on, function of those values).
+
+    Names that are depended on but not derived are the graph's inputs. A value
+    is only available once every value it depends on is.
+    """
+    def __init__(self, nodes: Dict[str, Tuple[Tuple[str, ...], Callable]]):
+        self.nodes = nodes
+        self.inputs = frozenset(name for dependencies, _ in nodes.values() for name in dependencies) - set(nodes)
+        self.order = self._sort()
+
+    def _sort(self) -> List[str]:
+        order = []
+        visiting = set()
+        done = set(self.inputs)
+
+        def visit(name: str):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle through '{name}'")
+            visiting.add(name)
+            for dependency in self.nodes[name][0]:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name)
+        return order
+
+class IncrementalSession:
+    """The inputs of one DependencyGraph and every value derived from them so far"""
+    def __init__(self, graph: DependencyGraph, inputs: Optional[Dict[str, Any]] = None):
+        self.graph = graph
+        self.values: Dict[str, Any] = dict(inputs or {})
+        self.evaluations = 0
+        # Error message per derived value whose function raised in the last evaluation
+        self.errors: Dict[str, str] = {}
+        self._evaluate(set(), everything=True)
+
+    def update(self, changes: Dict[str, Any], cleared: Iterable[str] = ()) -> Dict[str, Any]:
+        """Set and clear inputs, returning the derived values that changed.
+
+        A derived value that is no longer available is returned as None.
+        """
+        changed = set()
+        for name, value in changes.items():
+            if name not in self.graph.inputs:
+                raise KeyError(name)
+            if self.values.get(name, _MISSING) != value:
+                self.values[name] = value
+                changed.add(name)
+        for name in cleared:
+            if self.values.pop(name, _MISSING) is not _MISSING:
+                changed.add(name)
+        return self._evaluate(changed)
+
+    def _evaluate(self, changed: set, everything: bool = False) -> Dict[str, Any]:
+        updates = {}
+        self.errors = {}
+        for name in self.graph.order:
+            dependencies, function = self.graph.nodes[name]
+            if not everything and changed.isdisjoint(dependencies):
+                continue
+            old = self.values.get(name, _MISSING)
+            if all(dependency in self.values for dependency in dependencies):
+                self.evaluations += 1
+                try:
+                    new = function(*(self.values[dependency] for dependency in dependencies))
+                except Exception as e:
+                    self.errors[name] = f"Could not be calculated: {e}"
+                    new = _MISSING
+            else:
+                new = _MISSING
+            if new is _MISSING:
+                self.values.pop(name, None)
+            else:
+                self.values[name] = new
+            if old is new or (old is not _MISSING and new is not _MISSING and old == new):
+                continue
+            changed.add(name)
+            updates[name] = None if new is _MISSING else new
+        return updates
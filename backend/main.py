@@ -1,11 +1,103 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from fastapi.responses import Response, StreamingResponse
+from starlette.requests import ClientDisconnect
+from pydantic import BaseModel, Field, ValidationError, confloat, constr
+from typing import Optional, List, Callable, Iterable, Iterator, Sequence, Tuple
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
 import math
+import multiprocessing
+import os
+import random
+import re
+import warnings
+import numpy as np
 
-app = FastAPI(title="Health Assessment API")
+from admission import AdmissionMiddleware, ConcurrencyLimiter, TokenBuckets
+from cohort_store import CohortStore
+from compression import FragmentCompressor
+from history_store import TREND_METRICS, HistoryStore
+from incremental import DependencyGraph, IncrementalSession
+from meal_planner import MEALS, MealPlanner, load_foods
+from metrics import MetricsMiddleware, Registry, StageTimer
+from micro_batching import MicroBatcher
+from profiling import ProfileAggregator
+from quantile_sketch import SketchSet, TDigest
+from result_cache import ResultCache
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_process_pool()
+    if HISTORY_STORE is not None:
+        HISTORY_STORE.start()
+    if COHORT_STORE is not None:
+        COHORT_STORE.start()
+    yield
+    if COHORT_STORE is not None:
+        COHORT_STORE.stop()
+    if HISTORY_STORE is not None:
+        HISTORY_STORE.stop()
+    stop_process_pool()
+
+app = FastAPI(title="Health Assessment API", lifespan=lifespan)
+
+# Metrics
+# Exposed in the Prometheus text format on GET /metrics
+METRICS = Registry()
+HTTP_REQUESTS = METRICS.counter("http_requests_total", "HTTP requests by path and status code", ("path", "status"))
+HTTP_REQUEST_DURATION = METRICS.histogram(
+    "http_request_duration_seconds", "HTTP request duration, including request validation", ("path",))
+HTTP_REQUESTS_IN_FLIGHT = METRICS.gauge("http_requests_in_flight", "HTTP requests currently being handled", ("path",))
+ASSESSMENT_ERRORS = METRICS.counter(
+    "assessment_errors_total", "Assessments that failed with an internal error", ("endpoint",))
+ASSESSMENT_STAGE_DURATION = METRICS.histogram(
+    "assessment_stage_duration_seconds", "Time spent in each stage of an uncached /assess request", ("stage",))
+
+# Admission Control
+# With ADMISSION_MAX_CONCURRENCY set, at most that many requests are handled at
+# once and up to ADMISSION_MAX_QUEUE more wait, each for at most
+# ADMISSION_QUEUE_TIMEOUT_MS; with RATE_LIMIT_PER_SECOND set, each client also
+# gets a token bucket. Requests over either limit are rejected immediately
+# (503 or 429, with Retry-After) rather than queued without bound.
+# ADMISSION_EXEMPT_PATHS, such as load balancer probes, are never limited. The
+# middleware sits inside the CORS and metrics middleware, so rejections still
+# carry CORS headers and show up in http_requests_total.
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "0"))
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "0"))
+ADMISSION_LIMITER = ConcurrencyLimiter(
+    ADMISSION_MAX_CONCURRENCY,
+    max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "100")),
+    timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "1000")) / 1000
+) if ADMISSION_MAX_CONCURRENCY > 0 else None
+RATE_LIMIT_BUCKETS = TokenBuckets(
+    RATE_LIMIT_PER_SECOND,
+    burst=float(os.getenv("RATE_LIMIT_BURST", "20")),
+    max_clients=int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+) if RATE_LIMIT_PER_SECOND > 0 else None
+ADMISSION_SHED = METRICS.counter("admission_shed_total", "Requests rejected by admission control", ("reason",))
+ADMISSION_QUEUE_WAIT = METRICS.histogram(
+    "admission_queue_wait_seconds", "Time admitted requests waited for a concurrency slot")
+
+if ADMISSION_LIMITER is not None or RATE_LIMIT_BUCKETS is not None:
+    app.add_middleware(
+        AdmissionMiddleware,
+        shed=ADMISSION_SHED,
+        limiter=ADMISSION_LIMITER,
+        buckets=RATE_LIMIT_BUCKETS,
+        exempt_paths=[path.strip() for path in os.getenv("ADMISSION_EXEMPT_PATHS", "/health,/metrics").split(",") if path.strip()],
+        client_header=os.getenv("RATE_LIMIT_CLIENT_HEADER", ""),
+        queue_wait=ADMISSION_QUEUE_WAIT
+    )
 
 # Enable CORS for frontend
 app.add_middleware(
@@ -16,6 +108,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(
+    MetricsMiddleware,
+    requests=HTTP_REQUESTS,
+    duration=HTTP_REQUEST_DURATION,
+    in_flight=HTTP_REQUESTS_IN_FLIGHT,
+    known_paths=lambda: [route.path for route in app.routes]
+)
+
 # Models
 class UserHealthInfo(BaseModel):
     name: str = Field(..., min_length=1)
@@ -49,7 +149,60 @@ class PersonalizedPlan(BaseModel):
     lifestyle_tips: List[str]
     weekly_goals: dict
 
+class TrajectoryRequest(BaseModel):
+    age: int = Field(..., ge=1, le=120)
+    gender: str = Field(..., pattern="^(male|female|other)$")
+    height: float = Field(..., gt=0, description="Height in cm")
+    weight: float = Field(..., gt=0, description="Weight in kg")
+    activity_level: str = Field(..., pattern="^(sedentary|lightly_active|moderately_active|very_active|extra_active)$")
+    goal: str = Field(..., pattern="^(lose_weight|maintain|gain_muscle|improve_fitness)$")
+    weeks: int = Field(12, ge=12, le=52)
+    activity_levels: Optional[List[constr(pattern="^(sedentary|lightly_active|moderately_active|very_active|extra_active)$")]] = Field(
+        None, min_length=1, max_length=5, description="Activity levels to sweep instead of activity_level")
+    goals: Optional[List[constr(pattern="^(lose_weight|maintain|gain_muscle|improve_fitness)$")]] = Field(
+        None, min_length=1, max_length=4, description="Goals to sweep instead of goal")
+    calorie_adjustments: Optional[List[confloat(ge=-1500, le=1500)]] = Field(
+        None, min_length=1, max_length=100,
+        description="Daily calorie deficits (negative) or surpluses to sweep instead of the goals' own adjustments")
+    adaptive_targets: bool = Field(
+        True, description="Re-plan the calorie target from each week's BMR; otherwise keep eating the week-0 target")
+
 # Health Calculations
+ACTIVITY_MULTIPLIERS = {
+    "sedentary": 1.2,
+    "lightly_active": 1.375,
+    "moderately_active": 1.55,
+    "very_active": 1.725,
+    "extra_active": 1.9
+}
+
+# Enumerated inputs. Their positions double as the integer codes of the binary
+# record format, so new values must only ever be appended.
+GENDERS = ("male", "female", "other")
+ACTIVITY_LEVELS = tuple(ACTIVITY_MULTIPLIERS)
+GOALS = ("lose_weight", "maintain", "gain_muscle", "improve_fitness")
+DIETARY_PREFERENCES = (None, "none", "vegetarian", "vegan", "keto", "paleo")
+GENDER_CODES = {value: code for code, value in enumerate(GENDERS)}
+ACTIVITY_LEVEL_CODES = {value: code for code, value in enumerate(ACTIVITY_LEVELS)}
+GOAL_CODES = {value: code for code, value in enumerate(GOALS)}
+DIETARY_PREFERENCE_CODES = {value: code for code, value in enumerate(DIETARY_PREFERENCES)}
+
+# (protein, carbs, fats) share of daily calories per goal
+MACRO_SPLITS = {
+    "lose_weight": (0.35, 0.35, 0.30),
+    "gain_muscle": (0.30, 0.45, 0.25)
+}
+DEFAULT_MACRO_SPLIT = (0.25, 0.50, 0.25)
+# Diets with a macro split of their own, which replaces the goal's
+DIET_MACRO_SPLITS = {
+    "keto": (0.25, 0.10, 0.65)
+}
+
+GOAL_CALORIE_ADJUSTMENTS = {
+    "lose_weight": -500,
+    "gain_muscle": 300
+}
+
 def calculate_bmi(weight: float, height: float) -> float:
     """Calculate BMI: weight(kg) / (height(m))^2"""
     height_m = height / 100
@@ -76,15 +229,7 @@ def calculate_bmr(weight: float, height: float, age: int, gender: str) -> float:
 
 def calculate_daily_calories(bmr: float, activity_level: str, goal: str) -> float:
     """Calculate daily calorie needs based on activity level and goals"""
-    activity_multipliers = {
-        "sedentary": 1.2,
-        "lightly_active": 1.375,
-        "moderately_active": 1.55,
-        "very_active": 1.725,
-        "extra_active": 1.9
-    }
-    
-    tdee = bmr * activity_multipliers.get(activity_level, 1.2)
+    tdee = bmr * ACTIVITY_MULTIPLIERS.get(activity_level, 1.2)
     
     # Adjust based on goal
     if goal == "lose_weight":
@@ -94,20 +239,13 @@ def calculate_daily_calories(bmr: float, activity_level: str, goal: str) -> floa
     else:
         return round(tdee, 2)
 
-def calculate_macros(daily_calories: float, goal: str) -> dict:
+def get_macro_shares(goal: str, dietary_preference: Optional[str] = None) -> Tuple[float, float, float]:
+    """The (protein, carbs, fats) split for a goal, or the diet's own split if it has one"""
+    return DIET_MACRO_SPLITS.get(dietary_preference) or MACRO_SPLITS.get(goal, DEFAULT_MACRO_SPLIT)
+
+def calculate_macros(daily_calories: float, goal: str, dietary_preference: Optional[str] = None) -> dict:
     """Calculate macronutrient distribution"""
-    if goal == "lose_weight":
-        protein_percent = 0.35
-        carbs_percent = 0.35
-        fats_percent = 0.30
-    elif goal == "gain_muscle":
-        protein_percent = 0.30
-        carbs_percent = 0.45
-        fats_percent = 0.25
-    else:
-        protein_percent = 0.25
-        carbs_percent = 0.50
-        fats_percent = 0.25
+    protein_percent, carbs_percent, fats_percent = get_macro_shares(goal, dietary_preference)
     
     return {
         "protein": round((daily_calories * protein_percent) / 4, 2),
@@ -129,6 +267,96 @@ def calculate_ideal_weight(height: float, gender: str) -> dict:
         "range": f"{min_weight}-{max_weight} kg"
     }
 
+# Vectorized Calculations
+BMI_CATEGORIES = ("Underweight", "Normal weight", "Overweight", "Obese")
+BMI_CATEGORY_BOUNDS = (18.5, 25, 30)
+
+def round_like_scalar(values: np.ndarray, ndigits: int, exact: Callable[[int], float]) -> np.ndarray:
+    """Round an array the way round() does.
+
+    np.round scales by 10**ndigits before rounding, so it can disagree with the
+    built-in round() when a value sits within a hair of a .5 boundary. Those few
+    entries are recomputed with the scalar formula via exact(index).
+    """
+    rounded = np.round(values, ndigits)
+    scaled = values * (10.0 ** ndigits)
+    near_tie = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_tie):
+        rounded[i] = exact(int(i))
+    return rounded
+
+def calculate_metrics_batch(users: List[UserHealthInfo]) -> dict:
+    """Calculate BMI, BMR, calories, macros, ideal weight and water for many users in one array pass.
+
+    Every value matches what the scalar calculate_* functions return for the same user.
+    """
+    n = len(users)
+    return calculate_metrics_columns(
+        weight=np.fromiter((u.weight for u in users), dtype=np.float64, count=n),
+        height=np.fromiter((u.height for u in users), dtype=np.float64, count=n),
+        age=np.fromiter((u.age for u in users), dtype=np.int64, count=n),
+        gender=np.fromiter((GENDER_CODES[u.gender] for u in users), dtype=np.intp, count=n),
+        activity_level=np.fromiter((ACTIVITY_LEVEL_CODES[u.activity_level] for u in users), dtype=np.intp, count=n),
+        goal=np.fromiter((GOAL_CODES[u.goal] for u in users), dtype=np.intp, count=n),
+        dietary_preference=np.fromiter((DIETARY_PREFERENCE_CODES[u.dietary_preference] for u in users), dtype=np.intp, count=n)
+    )
+
+def calculate_metrics_columns(weight: np.ndarray, height: np.ndarray, age: np.ndarray, gender: np.ndarray,
+                              activity_level: np.ndarray, goal: np.ndarray, dietary_preference: np.ndarray) -> dict:
+    """Array core of calculate_metrics_batch.
+
+    gender, activity_level, goal and dietary_preference are integer codes
+    indexing GENDERS, ACTIVITY_LEVELS, GOALS and DIETARY_PREFERENCES.
+    """
+    # Widen so the formulas never wrap around in a narrow input dtype
+    age = age.astype(np.int64)
+    gender_offset = np.where(gender == GENDER_CODES["male"], 5.0, -161.0)
+    multiplier = np.array([ACTIVITY_MULTIPLIERS[level] for level in ACTIVITY_LEVELS])[activity_level]
+    adjustment = np.array([GOAL_CALORIE_ADJUSTMENTS.get(g, 0) for g in GOALS], dtype=np.float64)[goal]
+    splits = np.array([[get_macro_shares(g, d) for d in DIETARY_PREFERENCES] for g in GOALS])[goal, dietary_preference]
+    
+    # Scalar inputs for the few values that need recomputing near a rounding boundary
+    def scalar_inputs(i: int) -> tuple:
+        return float(weight[i]), float(height[i]), int(age[i]), GENDERS[gender[i]], ACTIVITY_LEVELS[activity_level[i]], GOALS[goal[i]]
+
+    def exact_macros(i: int) -> dict:
+        return calculate_macros(float(daily_calories[i]), GOALS[goal[i]], DIETARY_PREFERENCES[dietary_preference[i]])
+    
+    def exact_bmr(i: int) -> float:
+        w, h, a, g, _, _ = scalar_inputs(i)
+        return calculate_bmr(w, h, a, g)
+    
+    height_m = height / 100
+    height_m_sq = height_m ** 2
+    
+    bmi = round_like_scalar(weight / height_m_sq, 2,
+                            lambda i: calculate_bmi(float(weight[i]), float(height[i])))
+    bmr = round_like_scalar((10 * weight) + (6.25 * height) - (5 * age) + gender_offset, 2, exact_bmr)
+    daily_calories = round_like_scalar((bmr * multiplier) + adjustment, 2,
+                                       lambda i: calculate_daily_calories(float(bmr[i]), *scalar_inputs(i)[4:]))
+    macro_calories = daily_calories[:, None] * splits
+    protein = round_like_scalar(macro_calories[:, 0] / 4, 2, lambda i: exact_macros(i)["protein"])
+    carbs = round_like_scalar(macro_calories[:, 1] / 4, 2, lambda i: exact_macros(i)["carbs"])
+    fats = round_like_scalar(macro_calories[:, 2] / 9, 2, lambda i: exact_macros(i)["fats"])
+    min_weight = round_like_scalar(18.5 * height_m_sq, 1,
+                                   lambda i: calculate_ideal_weight(float(height[i]), GENDERS[gender[i]])["min_kg"])
+    max_weight = round_like_scalar(24.9 * height_m_sq, 1,
+                                   lambda i: calculate_ideal_weight(float(height[i]), GENDERS[gender[i]])["max_kg"])
+    water_liters = round_like_scalar(weight * 0.033, 1, lambda i: round(float(weight[i]) * 0.033, 1))
+    
+    return {
+        "bmi": bmi,
+        "bmi_category": np.digitize(bmi, BMI_CATEGORY_BOUNDS),
+        "bmr": bmr,
+        "daily_calories": daily_calories,
+        "protein": protein,
+        "carbs": carbs,
+        "fats": fats,
+        "min_kg": min_weight,
+        "max_kg": max_weight,
+        "water_liters": water_liters
+    }
+
 def assess_health_risks(bmi: float, age: int, medical_conditions: Optional[List[str]]) -> List[str]:
     """Identify potential health risks"""
     risks = []
@@ -219,6 +447,142 @@ def generate_recommendations(user: UserHealthInfo, bmi: float, bmi_category: str
     
     return recommendations[:12]  # Return top 12 recommendations
 
+# Decision Tables
+# The rules behind assess_health_risks and generate_recommendations, written as
+# data. A rule lists, per dimension, the values it applies to (a dimension it
+# leaves out matches everything) and the texts it contributes. The rules are
+# compiled at startup into tables covering every combination of inputs, so a
+# request does a single lookup that returns a shared, immutable tuple.
+UNDERWEIGHT, NORMAL_WEIGHT, OVERWEIGHT, OBESE = range(len(BMI_CATEGORIES))
+AGE_BAND_BOUNDS = (40, 50)
+AGE_UP_TO_40, AGE_41_TO_50, AGE_OVER_50 = range(len(AGE_BAND_BOUNDS) + 1)
+
+RISK_RULES = (
+    ({"bmi_band": (UNDERWEIGHT,)}, (
+        "Increased risk of nutritional deficiencies and weakened immune system",
+        "Potential bone density issues"
+    )),
+    ({"bmi_band": (OVERWEIGHT,)}, (
+        "Moderate risk of cardiovascular disease",
+        "Increased risk of type 2 diabetes"
+    )),
+    ({"bmi_band": (OBESE,)}, (
+        "High risk of cardiovascular disease",
+        "Significantly increased risk of type 2 diabetes",
+        "Risk of sleep apnea and joint problems",
+        "Increased risk of certain cancers"
+    )),
+    ({"bmi_band": (OVERWEIGHT, OBESE), "age_band": (AGE_41_TO_50, AGE_OVER_50)}, (
+        "Age-related metabolic slowdown combined with excess weight",
+    )),
+)
+NO_HEALTH_RISKS = ("No significant health risks identified",)
+
+RECOMMENDATION_RULES = (
+    ({"bmi_band": (UNDERWEIGHT,)}, (
+        "Focus on nutrient-dense, calorie-rich foods",
+        "Incorporate strength training to build muscle mass",
+        "Eat 5-6 smaller meals throughout the day",
+        "Consider protein shakes as supplements"
+    )),
+    ({"bmi_band": (OVERWEIGHT, OBESE)}, (
+        "Create a sustainable calorie deficit through balanced eating",
+        "Increase physical activity gradually",
+        "Focus on whole foods and reduce processed foods",
+        "Practice portion control and mindful eating"
+    )),
+    ({"goal": ("lose_weight",)}, (
+        "Aim for 0.5-1 kg weight loss per week for sustainable results",
+        "Combine cardio exercises with strength training",
+        "Stay hydrated - drink water before meals",
+        "Get 7-9 hours of quality sleep per night"
+    )),
+    ({"goal": ("gain_muscle",)}, (
+        "Prioritize progressive overload in strength training",
+        "Ensure adequate protein intake (1.6-2.2g per kg body weight)",
+        "Allow proper recovery time between workouts",
+        "Consider creatine supplementation (consult a professional)"
+    )),
+    ({"goal": ("improve_fitness",)}, (
+        "Include a mix of cardio, strength, and flexibility training",
+        "Set specific, measurable fitness goals",
+        "Track your progress weekly",
+        "Gradually increase workout intensity"
+    )),
+    ({"activity_level": ("sedentary",)}, (
+        "Start with 10-15 minute walks daily and gradually increase",
+        "Take regular breaks from sitting every hour"
+    )),
+    ({"age_band": (AGE_OVER_50,)}, (
+        "Include balance and flexibility exercises to prevent falls",
+        "Focus on bone-strengthening activities",
+        "Consider vitamin D and calcium supplementation (consult doctor)"
+    )),
+    ({}, (
+        "Regular health check-ups and blood work annually",
+        "Manage stress through meditation or yoga",
+        "Limit alcohol consumption and avoid smoking",
+        "Build a support system for accountability"
+    )),
+)
+MAX_RECOMMENDATIONS = 12
+
+def get_bmi_band(bmi: float) -> int:
+    """Index of the WHO BMI category (see BMI_CATEGORIES)"""
+    return bisect_right(BMI_CATEGORY_BOUNDS, bmi)
+
+def get_age_band(age: int) -> int:
+    """Age band used by the decision tables: up to 40, 41-50 or over 50"""
+    return bisect_left(AGE_BAND_BOUNDS, age)
+
+def compile_decision_table(rules: tuple, dimensions: dict) -> dict:
+    """Evaluate rules for every combination of dimension values, keyed by the value tuple"""
+    table = {}
+    for cell in itertools.product(*dimensions.values()):
+        values = dict(zip(dimensions, cell))
+        table[cell] = tuple(
+            text
+            for when, texts in rules
+            if all(values[dimension] in allowed for dimension, allowed in when.items())
+            for text in texts
+        )
+    return table
+
+AGE_BAND_COUNT = len(AGE_BAND_BOUNDS) + 1
+
+RISK_TABLE_DIMENSIONS = {
+    "bmi_band": range(len(BMI_CATEGORIES)),
+    "age_band": range(AGE_BAND_COUNT)
+}
+RISK_TABLE = compile_decision_table(RISK_RULES, RISK_TABLE_DIMENSIONS)
+# RISK_TABLE flattened to bmi_band * AGE_BAND_COUNT + age_band, without and with
+# the fallback for cells that have no risks, so a lookup is two bisections and an index
+RISK_CELLS = tuple(RISK_TABLE[cell] for cell in itertools.product(*RISK_TABLE_DIMENSIONS.values()))
+RISK_CELLS_OR_NONE = tuple(risks or NO_HEALTH_RISKS for risks in RISK_CELLS)
+
+RECOMMENDATION_TABLE_DIMENSIONS = {
+    "bmi_band": range(len(BMI_CATEGORIES)),
+    "goal": GOALS,
+    "activity_level": ACTIVITY_LEVELS,
+    "age_band": range(AGE_BAND_COUNT)
+}
+RECOMMENDATION_TABLE = {
+    cell: texts[:MAX_RECOMMENDATIONS]
+    for cell, texts in compile_decision_table(RECOMMENDATION_RULES, RECOMMENDATION_TABLE_DIMENSIONS).items()
+}
+
+def lookup_health_risks(bmi: float, age: int, medical_conditions: Optional[List[str]]) -> tuple:
+    """Table-driven equivalent of assess_health_risks"""
+    cell = bisect_right(BMI_CATEGORY_BOUNDS, bmi) * AGE_BAND_COUNT + bisect_left(AGE_BAND_BOUNDS, age)
+    if medical_conditions:
+        # The only free-text input, so it is appended rather than tabulated
+        return RISK_CELLS[cell] + (f"Existing conditions require medical supervision: {', '.join(medical_conditions)}",)
+    return RISK_CELLS_OR_NONE[cell]
+
+def lookup_recommendations(user: UserHealthInfo, bmi: float) -> tuple:
+    """Table-driven equivalent of generate_recommendations"""
+    return RECOMMENDATION_TABLE[(get_bmi_band(bmi), user.goal, user.activity_level, get_age_band(user.age))]
+
 def generate_workout_plan(user: UserHealthInfo, bmi_category: str) -> List[dict]:
     """Generate a weekly workout plan"""
     base_cardio_duration = 30 if user.activity_level in ["sedentary", "lightly_active"] else 45
@@ -254,135 +618,77 @@ def generate_workout_plan(user: UserHealthInfo, bmi_category: str) -> List[dict]
             {"day": "Sunday", "type": "Rest", "activity": "Light walk or rest", "duration": "Optional", "intensity": "Low"}
         ]
 
-def generate_meal_suggestions(daily_calories: float, macros: dict, dietary_preference: Optional[str]) -> List[dict]:
-    """Generate meal suggestions based on calorie needs and dietary preferences"""
+# Share of daily calories for breakfast, lunch, dinner and snacks
+MEAL_CALORIE_SHARES = (0.25, 0.35, 0.30, 0.10)
+
+FOOD_DATABASE_PATH = os.getenv("FOOD_DATABASE_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "foods.json")
+MEAL_PLANNER = MealPlanner(load_foods(FOOD_DATABASE_PATH),
+                           suggestions=int(os.getenv("MEAL_SUGGESTIONS_PER_MEAL", "3")))
+# Every split calculate_macros() can produce
+KNOWN_MACRO_SPLITS = tuple(dict.fromkeys((*MACRO_SPLITS.values(), DEFAULT_MACRO_SPLIT, *DIET_MACRO_SPLITS.values())))
+
+def calculate_meal_calories(daily_calories: float) -> List[int]:
+    """Split daily calories across breakfast, lunch, dinner and snacks"""
+    return [round(daily_calories * share) for share in MEAL_CALORIE_SHARES]
+
+def get_macro_split(macros: dict) -> Tuple[float, float, float]:
+    """The known macro split closest to the calorie shares of macros"""
+    energy = [macros.get("protein", 0) * 4, macros.get("carbs", 0) * 4, macros.get("fats", 0) * 9]
+    total = sum(energy)
+    if total <= 0:
+        return DEFAULT_MACRO_SPLIT
+    shares = [value / total for value in energy]
+    return min(KNOWN_MACRO_SPLITS, key=lambda split: sum((a - b) ** 2 for a, b in zip(split, shares)))
+
+def get_meal_plan(dietary_preference: Optional[str], split: Tuple[float, float, float]) -> tuple:
+    """Cached candidate combinations for each meal, from MEAL_PLANNER"""
+    return MEAL_PLANNER.plan(None if dietary_preference in (None, "none") else dietary_preference, split)
+
+def drop_empty_meals(plan: tuple, daily_calories: float) -> tuple:
+    """plan without suggestions for meals that get no calories"""
+    return tuple(candidates if calories > 0 else ()
+                 for calories, candidates in zip(calculate_meal_calories(daily_calories), plan))
+
+def meal_suggestion_values(daily_calories: float, macros: dict, plan: tuple) -> list:
+    """The numbers in a meal plan, in the order they appear in it.
+
+    Per meal: its calories, its protein, carbs and fats targets, then for each
+    suggestion the grams of every food followed by the protein, carbs and fats
+    those portions give.
+    """
+    values = []
+    for calories, share, candidates in zip(calculate_meal_calories(daily_calories), MEAL_CALORIE_SHARES, plan):
+        values.append(calories)
+        values.extend(round(macros[nutrient] * share, 1) for nutrient in ("protein", "carbs", "fats"))
+        for candidate in candidates:
+            grams, achieved = MEAL_PLANNER.portions(candidate, calories)
+            values.extend(grams)
+            values.extend(achieved)
+    return values
+
+def build_meal_suggestions(plan: tuple, values: Iterable) -> List[dict]:
+    """Lay out a meal plan, taking its numbers in meal_suggestion_values() order"""
+    values = iter(values)
     meals = []
-    
-    breakfast_cals = round(daily_calories * 0.25)
-    lunch_cals = round(daily_calories * 0.35)
-    dinner_cals = round(daily_calories * 0.30)
-    snack_cals = round(daily_calories * 0.10)
-    
-    if dietary_preference == "vegetarian":
-        meals = [
-            {
-                "meal": "Breakfast",
-                "calories": breakfast_cals,
-                "suggestions": [
-                    "1 cup (80g) oatmeal with 1/2 cup berries, 1/4 cup mixed nuts, and 1 tbsp honey",
-                    "1 cup (240g) Greek yogurt with 1/3 cup granola and 1/2 cup mixed fruit",
-                    "2 slices whole grain toast with 1/2 avocado and 2 scrambled eggs"
-                ]
-            },
-            {
-                "meal": "Lunch",
-                "calories": lunch_cals,
-                "suggestions": [
-                    "1 cup (185g) cooked quinoa with 1.5 cups roasted vegetables and 3/4 cup chickpeas",
-                    "2 cups lentil soup with 2 slices whole grain bread and large mixed salad",
-                    "1.5 cups mixed vegetable stir-fry with 150g tofu and 1 cup brown rice"
-                ]
-            },
-            {
-                "meal": "Dinner",
-                "calories": dinner_cals,
-                "suggestions": [
-                    "2 large grilled portobello mushrooms with 1 medium sweet potato and 2 cups greens",
-                    "1.5 cups vegetable curry with 100g paneer and 3/4 cup cooked quinoa",
-                    "2 cups pasta primavera with 2 tbsp olive oil and 2 tbsp parmesan"
-                ]
-            },
-            {
-                "meal": "Snacks",
-                "calories": snack_cals,
-                "suggestions": [
-                    "1/4 cup (60g) hummus with 1 cup vegetable sticks (carrots, celery, peppers)",
-                    "1/4 cup mixed nuts and 2 tbsp dried fruit",
-                    "1 medium apple sliced with 2 tbsp almond butter"
-                ]
-            }
-        ]
-    elif dietary_preference == "vegan":
-        meals = [
-            {
-                "meal": "Breakfast",
-                "calories": breakfast_cals,
-                "suggestions": [
-                    "1 smoothie bowl with 1 scoop protein powder, 1 cup mixed fruits, and 2 tbsp seeds",
-                    "1 cup (80g) overnight oats with 1 cup plant milk, 1 tbsp chia seeds, and 1/2 cup berries",
-                    "2 slices whole grain toast with 2 tbsp peanut butter and 1 sliced banana"
-                ]
-            },
-            {
-                "meal": "Lunch",
-                "calories": lunch_cals,
-                "suggestions": [
-                    "Buddha bowl: 3/4 cup quinoa, 3/4 cup chickpeas, 1.5 cups veggies, 2 tbsp tahini dressing",
-                    "Burrito bowl: 3/4 cup black beans, 1 medium sweet potato, 1/2 cup rice, salsa & guacamole",
-                    "2 cups lentil vegetable soup with 10-12 whole grain crackers"
-                ]
-            },
-            {
-                "meal": "Dinner",
-                "calories": dinner_cals,
-                "suggestions": [
-                    "150g tofu stir-fry with 2 cups mixed vegetables and 1 cup brown rice",
-                    "2 cups vegan chili with 1 piece (100g) cornbread",
-                    "2 cups pasta (150g dry) with 1 cup marinara sauce and 2 tbsp nutritional yeast"
-                ]
-            },
-            {
-                "meal": "Snacks",
-                "calories": snack_cals,
-                "suggestions": [
-                    "1/2 cup (80g) roasted chickpeas",
-                    "2-3 energy balls made with 3-4 dates and 1/4 cup nuts",
-                    "1 oz (28g) vegetable chips with 1/4 cup guacamole"
-                ]
-            }
-        ]
-    else:  # none, keto, paleo, or default
-        meals = [
-            {
-                "meal": "Breakfast",
-                "calories": breakfast_cals,
-                "suggestions": [
-                    "3 scrambled eggs with 1 cup spinach and 2 slices whole grain toast",
-                    "Protein smoothie: 1 scoop protein powder, 1 banana, 1/2 cup berries, 1/3 cup oats",
-                    "1 cup (240g) Greek yogurt with 1/3 cup granola, 1/4 cup nuts, and 1 tbsp honey"
-                ]
-            },
-            {
-                "meal": "Lunch",
-                "calories": lunch_cals,
-                "suggestions": [
-                    "150g grilled chicken with 3 cups mixed greens salad and 2 tbsp vinaigrette",
-                    "Large wrap: 120g turkey, 1/2 avocado, 1 cup vegetables, whole wheat tortilla",
-                    "150g baked salmon with 3/4 cup quinoa and 1.5 cups roasted vegetables"
-                ]
-            },
-            {
-                "meal": "Dinner",
-                "calories": dinner_cals,
-                "suggestions": [
-                    "150g lean beef or chicken with 1 medium sweet potato and 1.5 cups steamed broccoli",
-                    "150g baked fish with 1 cup brown rice and 1 cup asparagus",
-                    "5-6 turkey meatballs (150g) with 1.5 cups whole wheat pasta and 1 cup vegetables"
-                ]
-            },
-            {
-                "meal": "Snacks",
-                "calories": snack_cals,
-                "suggestions": [
-                    "1 protein bar (30g protein) or 1 scoop protein shake",
-                    "1 cup (225g) cottage cheese with 1/2 cup mixed fruit",
-                    "2 hard-boiled eggs with 1 cup cherry tomatoes"
-                ]
-            }
-        ]
-    
+    for meal, candidates in zip(MEALS, plan):
+        entry = {
+            "meal": meal.title(),
+            "calories": next(values),
+            "macros": {"protein": next(values), "carbs": next(values), "fats": next(values)}
+        }
+        suggestions = []
+        for candidate in candidates:
+            portions = ", ".join(f"{next(values)}g {food.name}" for food in candidate.foods)
+            suggestions.append(f"{portions} ({next(values)}g protein, {next(values)}g carbs, {next(values)}g fats)")
+        entry["suggestions"] = suggestions
+        meals.append(entry)
     return meals
 
+def generate_meal_suggestions(daily_calories: float, macros: dict, dietary_preference: Optional[str]) -> List[dict]:
+    """Generate meal suggestions whose portions hit each meal's share of the calorie and macro targets"""
+    plan = drop_empty_meals(get_meal_plan(dietary_preference, get_macro_split(macros)), daily_calories)
+    return build_meal_suggestions(plan, meal_suggestion_values(daily_calories, macros, plan))
+
 def generate_lifestyle_tips(user: UserHealthInfo) -> List[str]:
     """Generate lifestyle and wellness tips"""
     return [
@@ -428,6 +734,1071 @@ def generate_weekly_goals(user: UserHealthInfo, daily_calories: float) -> dict:
             "tracking": "Monitor energy levels and performance"
         }
 
+def calculate_health_metrics(user_info: UserHealthInfo) -> dict:
+    """Calculate the numeric health metrics for one user"""
+    bmi = calculate_bmi(user_info.weight, user_info.height)
+    bmr = calculate_bmr(user_info.weight, user_info.height, user_info.age, user_info.gender)
+    daily_calories = calculate_daily_calories(bmr, user_info.activity_level, user_info.goal)
+    return {
+        "bmi": bmi,
+        "bmr": bmr,
+        "daily_calories": daily_calories,
+        "macros": calculate_macros(daily_calories, user_info.goal, user_info.dietary_preference),
+        "ideal_weight": calculate_ideal_weight(user_info.height, user_info.gender),
+        "water_liters": round(user_info.weight * 0.033, 1)  # 33ml per kg body weight
+    }
+
+def iter_health_metrics_batch(users: List[UserHealthInfo]) -> Iterator[dict]:
+    """Yield calculate_health_metrics() results for many users, computed in a single NumPy pass"""
+    if not users:
+        return
+    
+    metrics = {key: values.tolist() for key, values in calculate_metrics_batch(users).items()}
+    for i in range(len(users)):
+        min_weight = metrics["min_kg"][i]
+        max_weight = metrics["max_kg"][i]
+        yield {
+            "bmi": metrics["bmi"][i],
+            "bmr": metrics["bmr"][i],
+            "daily_calories": metrics["daily_calories"][i],
+            "macros": {"protein": metrics["protein"][i], "carbs": metrics["carbs"][i], "fats": metrics["fats"][i]},
+            "ideal_weight": {"min_kg": min_weight, "max_kg": max_weight, "range": f"{min_weight}-{max_weight} kg"},
+            "water_liters": metrics["water_liters"][i]
+        }
+
+def build_assessment_content(user_info: UserHealthInfo, metrics: dict, fields: Optional[Iterable[str]] = None) -> dict:
+    """Build the HealthAssessment fields, in model order, from calculated health metrics.
+
+    With fields, only those entries are returned, and the risk and
+    recommendation lookups only run when asked for.
+    """
+    bmi = metrics["bmi"]
+    macros = metrics["macros"]
+    content = {
+        "bmi": bmi,
+        "bmi_category": get_bmi_category(bmi),
+        "bmr": metrics["bmr"],
+        "daily_calories": metrics["daily_calories"],
+        "protein_grams": macros["protein"],
+        "carbs_grams": macros["carbs"],
+        "fats_grams": macros["fats"],
+        "water_liters": metrics["water_liters"],
+        "ideal_weight_range": metrics["ideal_weight"]
+    }
+    if fields is None or "health_risks" in fields:
+        content["health_risks"] = lookup_health_risks(bmi, user_info.age, user_info.medical_conditions)
+    if fields is None or "recommendations" in fields:
+        content["recommendations"] = lookup_recommendations(user_info, bmi)
+    if fields is None:
+        return content
+    return {field: value for field, value in content.items() if field in fields}
+
+def build_personalized_plan(user_info: UserHealthInfo, metrics: dict) -> PersonalizedPlan:
+    """Assemble the PersonalizedPlan model from calculated health metrics.
+
+    This is the reference path; the API serves the byte-identical output of
+    render_plan_json() instead of building and serializing the models.
+    """
+    assessment = HealthAssessment(**build_assessment_content(user_info, metrics))
+    daily_calories = metrics["daily_calories"]
+    return PersonalizedPlan(
+        user_info=user_info,
+        assessment=assessment,
+        workout_plan=generate_workout_plan(user_info, assessment.bmi_category),
+        meal_suggestions=generate_meal_suggestions(daily_calories, metrics["macros"], user_info.dietary_preference),
+        lifestyle_tips=generate_lifestyle_tips(user_info),
+        weekly_goals=generate_weekly_goals(user_info, daily_calories)
+    )
+
+def dump_json(content) -> bytes:
+    """Serialize JSON-compatible data the same way FastAPI's JSONResponse does"""
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+# Pre-serialized Plan Fragments
+# The workout plan, meal suggestions, lifestyle tips and weekly goals only vary
+# by goal, activity level and dietary preference, apart from a few calorie,
+# macro and portion numbers. Every variant is serialized once at startup with placeholders where
+# those numbers go, so a response is assembled by splicing bytes together.
+
+def fragment_placeholder(index: int) -> str:
+    """Marker for the index-th value spliced into a fragment"""
+    return f"\x00{index}\x00"
+
+_PLACEHOLDER_PATTERN = re.compile(rb'"\\u0000(\d+)\\u0000"|\\u0000(\d+)\\u0000')
+
+def compile_fragment(content) -> Tuple[bytes, ...]:
+    """Serialize content once and split it into the static byte pieces around its placeholders.
+
+    A placeholder that is a whole JSON string is replaced including its quotes,
+    so a raw JSON number can go in its place; one embedded in a longer string
+    is replaced by the text alone.
+    """
+    serialized = dump_json(content)
+    pieces = []
+    start = 0
+    for expected, match in enumerate(_PLACEHOLDER_PATTERN.finditer(serialized)):
+        assert int(match.group(1) or match.group(2)) == expected, "placeholders must appear in order"
+        pieces.append(serialized[start:match.start()])
+        start = match.end()
+    pieces.append(serialized[start:])
+    return tuple(pieces)
+
+def fill_fragment(pieces: Tuple[bytes, ...], values) -> bytes:
+    """Splice numbers into a compiled fragment's placeholders"""
+    parts = [pieces[0]]
+    for value, piece in zip(values, pieces[1:]):
+        parts.append(repr(value).encode())
+        parts.append(piece)
+    return b"".join(parts)
+
+def _fragment_user(**fields) -> UserHealthInfo:
+    return UserHealthInfo.model_construct(**fields)
+
+def _compile_meal_fragment(dietary_preference: Optional[str], split: Tuple[float, float, float]) -> Tuple[bytes, ...]:
+    placeholders = map(fragment_placeholder, itertools.count())
+    return compile_fragment(build_meal_suggestions(get_meal_plan(dietary_preference, split), placeholders))
+
+WORKOUT_PLAN_FRAGMENTS = {
+    (goal, activity_level): dump_json(generate_workout_plan(_fragment_user(goal=goal, activity_level=activity_level), None))
+    for goal in GOALS for activity_level in ACTIVITY_LEVELS
+}
+MEAL_SUGGESTION_FRAGMENTS = {
+    (dietary_preference, split): _compile_meal_fragment(dietary_preference, split)
+    for dietary_preference in DIETARY_PREFERENCES for split in KNOWN_MACRO_SPLITS
+}
+LIFESTYLE_TIPS_FRAGMENT = dump_json(generate_lifestyle_tips(_fragment_user()))
+WEEKLY_GOALS_FRAGMENTS = {
+    goal: compile_fragment(generate_weekly_goals(_fragment_user(goal=goal), fragment_placeholder(0))) for goal in GOALS
+}
+
+def render_plan_json(user_info: UserHealthInfo, assessment: dict) -> bytes:
+    """Render a PersonalizedPlan as JSON bytes, identical to serializing the model"""
+    return render_plan_head(user_info) + render_plan_tail(user_info, assessment)
+
+def render_plan_head(user_info: UserHealthInfo) -> bytes:
+    """Render the opening of a plan: the echoed user info"""
+    return b'{"user_info":' + dump_json(user_info.model_dump(mode="json"))
+
+def render_meal_suggestions(user_info: UserHealthInfo, daily_calories: float, macros: dict) -> bytes:
+    if min(calculate_meal_calories(daily_calories)) <= 0:
+        # The compiled fragments have a slot for every suggestion, so plans with empty meals are built in full
+        return dump_json(generate_meal_suggestions(daily_calories, macros, user_info.dietary_preference))
+    split = get_macro_split(macros)
+    plan = get_meal_plan(user_info.dietary_preference, split)
+    return fill_fragment(MEAL_SUGGESTION_FRAGMENTS[(user_info.dietary_preference, split)],
+                         meal_suggestion_values(daily_calories, macros, plan))
+
+def render_weekly_goals(user_info: UserHealthInfo, daily_calories: float) -> bytes:
+    weekly_goals = WEEKLY_GOALS_FRAGMENTS[user_info.goal]
+    return fill_fragment(weekly_goals, [daily_calories] * (len(weekly_goals) - 1))
+
+def render_plan_tail(user_info: UserHealthInfo, assessment: dict, timer: Optional[StageTimer] = None) -> bytes:
+    """Render everything in a plan after the user info; depends only on the inputs in result_cache_key()"""
+    return b"".join(render_plan_tail_parts(user_info, assessment, timer))
+
+def render_plan_tail_parts(user_info: UserHealthInfo, assessment: dict, timer: Optional[StageTimer] = None) -> Tuple[bytes, ...]:
+    """render_plan_tail() as its fragments, with the static ones shared rather than copied"""
+    serialized_assessment = dump_json(assessment)
+    if timer:
+        timer.lap("assessment_serialization")
+    workout_plan = WORKOUT_PLAN_FRAGMENTS[(user_info.goal, user_info.activity_level)]
+    if timer:
+        timer.lap("workout_plan")
+    daily_calories = assessment["daily_calories"]
+    macros = {"protein": assessment["protein_grams"], "carbs": assessment["carbs_grams"], "fats": assessment["fats_grams"]}
+    meal_suggestions = render_meal_suggestions(user_info, daily_calories, macros)
+    if timer:
+        timer.lap("meal_suggestions")
+    parts = (
+        b',"assessment":', serialized_assessment,
+        b',"workout_plan":', workout_plan,
+        b',"meal_suggestions":', meal_suggestions,
+        b',"lifestyle_tips":', LIFESTYLE_TIPS_FRAGMENT,
+        b',"weekly_goals":', render_weekly_goals(user_info, daily_calories),
+        b'}'
+    )
+    if timer:
+        timer.lap("plan_assembly")
+    return parts
+
+# Sparse Fieldsets
+# /assess?fields=assessment.bmi,assessment.daily_calories,weekly_goals returns only
+# the listed sections (or fields of user_info and assessment), and only the
+# work those sections need is done.
+PLAN_SECTIONS = tuple(PersonalizedPlan.model_fields)
+PLAN_SUBFIELDS = {
+    "user_info": tuple(UserHealthInfo.model_fields),
+    "assessment": tuple(HealthAssessment.model_fields)
+}
+SECTIONS_NEEDING_METRICS = {"assessment", "meal_suggestions", "weekly_goals"}
+
+def parse_fields(fields: str) -> dict:
+    """Parse a fields= parameter into {section: None for the whole section, or a set of its fields}"""
+    selection = {}
+    for item in filter(None, (part.strip() for part in fields.split(","))):
+        section, _, field = item.partition(".")
+        if section not in PLAN_SECTIONS or (field and field not in PLAN_SUBFIELDS.get(section, ())):
+            raise ValueError(f"Unknown field: {item}")
+        if not field:
+            selection[section] = None
+        elif section not in selection:
+            selection[section] = {field}
+        elif selection[section] is not None:
+            selection[section].add(field)
+    if not selection:
+        raise ValueError("fields must name at least one section")
+    return selection
+
+def render_plan_fields(user_info: UserHealthInfo, selection: dict) -> bytes:
+    """Render only the selected parts of a plan, in PersonalizedPlan field order"""
+    metrics = calculate_health_metrics(user_info) if SECTIONS_NEEDING_METRICS.intersection(selection) else None
+    parts = []
+    for section in PLAN_SECTIONS:
+        if section not in selection:
+            continue
+        fields = selection[section]
+        if section == "user_info":
+            content = dump_json(user_info.model_dump(mode="json", include=fields))
+        elif section == "assessment":
+            content = dump_json(build_assessment_content(user_info, metrics, fields))
+        elif section == "workout_plan":
+            content = WORKOUT_PLAN_FRAGMENTS[(user_info.goal, user_info.activity_level)]
+        elif section == "meal_suggestions":
+            content = render_meal_suggestions(user_info, metrics["daily_calories"], metrics["macros"])
+        elif section == "lifestyle_tips":
+            content = LIFESTYLE_TIPS_FRAGMENT
+        else:
+            content = render_weekly_goals(user_info, metrics["daily_calories"])
+        parts.append(b'"' + section.encode() + b'":' + content)
+    return b"{" + b",".join(parts) + b"}"
+
+def render_plans_batch_json(users: List[UserHealthInfo]) -> List[bytes]:
+    """Render plans for many users, calculating their health metrics in a single NumPy pass"""
+    return [render_plan_json(user_info, build_assessment_content(user_info, metrics))
+            for user_info, metrics in zip(users, iter_health_metrics_batch(users))]
+
+# Result Cache
+# Repeat submissions skip the calculation entirely. Entries hold the rendered
+# plan after the user info, as render_plan_tail_parts() fragments, so the
+# free-text name never reaches the key and the request's own user info is put
+# back in front on every hit.
+RESULT_CACHE = ResultCache(
+    max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000")),
+    ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_SECONDS", "300"))
+)
+
+def result_cache_key(user_info: UserHealthInfo) -> tuple:
+    """Canonical form of the inputs that determine a plan (everything except the name)"""
+    return (
+        user_info.age,
+        user_info.gender,
+        float(user_info.height),
+        float(user_info.weight),
+        user_info.activity_level,
+        user_info.goal,
+        user_info.dietary_preference or "none",
+        tuple(user_info.medical_conditions or ())
+    )
+
+# Micro-batching
+# Optionally, concurrent /assess requests that miss the cache are held for up to
+# MICRO_BATCH_MAX_WAIT_MS and their health metrics calculated together in one
+# vectorized pass. A request arriving while no other one is being calculated
+# skips the wait and takes the scalar path.
+MICRO_BATCHER = MicroBatcher(
+    lambda users: list(iter_health_metrics_batch(users)),
+    process_one=calculate_health_metrics,
+    max_batch_size=int(os.getenv("MICRO_BATCH_MAX_SIZE", "64")),
+    max_wait_seconds=float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", "2")) / 1000
+) if os.getenv("MICRO_BATCH_ENABLED", "false").lower() == "true" else None
+
+# Assessment History
+# With HISTORY_DB_PATH set, every full /assess response for a request carrying an
+# X-User-Id header is recorded in SQLite. The request only queues the serialized
+# assessment; a background writer thread stores it. A user's history can only be
+# read with the same X-User-Id header, or by a service holding HISTORY_READ_TOKEN.
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "")
+HISTORY_STORE = HistoryStore(
+    HISTORY_DB_PATH,
+    max_queue=int(os.getenv("HISTORY_QUEUE_SIZE", "10000")),
+    batch_size=int(os.getenv("HISTORY_BATCH_SIZE", "500"))
+) if HISTORY_DB_PATH else None
+HISTORY_READ_TOKEN = os.getenv("HISTORY_READ_TOKEN", "")
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+# Cursors are SQLite row ids, which are signed 64-bit integers
+HISTORY_MAX_CURSOR = 2 ** 63 - 1
+
+def assessment_json_from_tail(tail: bytes) -> bytes:
+    """The serialized HealthAssessment inside a render_plan_tail() result.
+
+    Quotes inside JSON strings are escaped, so the workout_plan key can only
+    appear as the key that follows the assessment.
+    """
+    return tail[len(b',"assessment":'):tail.index(b',"workout_plan":')]
+
+def require_history_store() -> HistoryStore:
+    if HISTORY_STORE is None:
+        raise HTTPException(status_code=404, detail="Assessment history is not enabled (set HISTORY_DB_PATH)")
+    return HISTORY_STORE
+
+def require_history_access(user_id: str, caller_id: Optional[str], token: Optional[str]):
+    if caller_id == user_id:
+        return
+    if HISTORY_READ_TOKEN and token is not None and hmac.compare_digest(token.encode(), HISTORY_READ_TOKEN.encode()):
+        return
+    raise HTTPException(status_code=403, detail="A matching X-User-Id header or a valid X-History-Token header is required")
+
+# Cohort Store
+# With COHORT_STORE_DIR set, the numeric outputs and encoded inputs of every full
+# /assess and /assess/binary assessment are appended to a columnar store, one
+# memory-mapped file per column, which GET /cohort/summary aggregates.
+COHORT_STORE_DIR = os.getenv("COHORT_STORE_DIR", "")
+COHORT_METRICS = ("bmi", "bmr", "daily_calories", "protein", "carbs", "fats", "water_liters")
+COHORT_COLUMNS = {
+    **{name: "<f8" for name in COHORT_METRICS},
+    "bmi_category": "u1",
+    "age": "u1",
+    "gender": "u1",
+    "activity_level": "u1",
+    "goal": "u1",
+    "dietary_preference": "u1"
+}
+# Labels of the integer codes in each categorical column
+COHORT_DIMENSIONS = {
+    "bmi_category": BMI_CATEGORIES,
+    "gender": GENDERS,
+    "activity_level": ACTIVITY_LEVELS,
+    "goal": GOALS,
+    "dietary_preference": DIETARY_PREFERENCES
+}
+COHORT_GROUPS = ("age_band", *COHORT_DIMENSIONS)
+
+def parse_cohort_row(item: tuple) -> tuple:
+    """Writer-thread half of record_assessment(): a serialized assessment plus encoded inputs to a cohort row"""
+    assessment, age, gender, activity_level, goal, dietary_preference = item
+    content = json.loads(assessment)
+    return (
+        content["bmi"], content["bmr"], content["daily_calories"], content["protein_grams"],
+        content["carbs_grams"], content["fats_grams"], content["water_liters"],
+        BMI_CATEGORIES.index(content["bmi_category"]), age, gender, activity_level, goal, dietary_preference
+    )
+
+COHORT_STORE = CohortStore(
+    COHORT_STORE_DIR,
+    COHORT_COLUMNS,
+    parse_row=parse_cohort_row,
+    max_queue=int(os.getenv("COHORT_QUEUE_SIZE", "10000"))
+) if COHORT_STORE_DIR else None
+
+def record_assessment(user_info: UserHealthInfo, user_id: Optional[str], tail_parts: Sequence[bytes]):
+    """Queue a rendered assessment, given as render_plan_tail_parts(), for the history and cohort stores that are enabled"""
+    if HISTORY_STORE is None and COHORT_STORE is None:
+        return
+    assessment = assessment_json_from_tail(b"".join(tail_parts))
+    if user_id is not None and HISTORY_STORE is not None:
+        HISTORY_STORE.record(user_id, user_info.weight, user_info.height, assessment)
+    if COHORT_STORE is not None:
+        COHORT_STORE.record((assessment, user_info.age, GENDER_CODES[user_info.gender],
+                             ACTIVITY_LEVEL_CODES[user_info.activity_level], GOAL_CODES[user_info.goal],
+                             DIETARY_PREFERENCE_CODES[user_info.dietary_preference or "none"]))
+
+def record_cohort_columns(records: np.ndarray, metrics: dict):
+    """Queue the results of a binary batch for the cohort store"""
+    if COHORT_STORE is None:
+        return
+    columns = {name: metrics[name] for name in COHORT_METRICS}
+    columns["bmi_category"] = metrics["bmi_category"]
+    for name in ("age", "gender", "activity_level", "goal"):
+        columns[name] = records[name]
+    # No preference is stored as "none" whichever way it was sent, as in record_assessment()
+    columns["dietary_preference"] = np.where(records["dietary_preference"] == DIETARY_PREFERENCE_CODES[None],
+                                             DIETARY_PREFERENCE_CODES["none"], records["dietary_preference"])
+    COHORT_STORE.append(columns)
+
+def age_band_labels(bounds: Sequence[int]) -> List[str]:
+    """Labels of the bands np.searchsorted(bounds, age, side="left") puts ages in, e.g. up to 40, 41-50, over 50"""
+    labels = [f"up to {bounds[0]}"] if bounds else ["all ages"]
+    labels += [f"{low + 1}-{high}" for low, high in zip(bounds, bounds[1:])]
+    if bounds:
+        labels.append(f"over {bounds[-1]}")
+    return labels
+
+def summarize_cohort(group_by: List[str], metrics: List[str], age_bands: List[int]) -> dict:
+    """Per-group counts, shares and metric statistics over the whole cohort store"""
+    columns = ["age" if name == "age_band" else name for name in group_by]
+    groups = COHORT_STORE.aggregate(
+        columns, metrics,
+        cardinality={name: len(labels) for name, labels in COHORT_DIMENSIONS.items()},
+        bins={"age": age_bands}
+    )
+    labels = {name: age_band_labels(age_bands) if name == "age_band" else COHORT_DIMENSIONS[name] for name in group_by}
+    total = sum(group["count"] for group in groups)
+    summary = []
+    for group in groups:
+        entry = {name: labels[name][code] for name, code in zip(group_by, group["key"])}
+        entry["count"] = group["count"]
+        entry["share"] = round(group["count"] / total, 6)
+        entry.update({name: group[name] for name in metrics})
+        summary.append(entry)
+    return {"rows": total, "group_by": group_by, "groups": summary}
+
+# Percentile Sketches
+# A t-digest per (age band, gender) for each of SKETCH_METRICS is updated from
+# every full /assess and /assess/binary assessment that is computed rather than
+# answered from the result cache, so /assess?percentiles=true can tell users
+# where they stand among people of their age band and gender without scanning
+# stored data. Each server process keeps its own sketches;
+# GET /percentiles/sketches exports them and POST /percentiles/sketches merges
+# an export into another process.
+PERCENTILES_ENABLED = os.getenv("PERCENTILES_ENABLED", "true").lower() == "true"
+SKETCH_METRICS = ("bmi", "bmr", "daily_calories")
+AGE_BAND_LABELS = age_band_labels(AGE_BAND_BOUNDS)
+PERCENTILE_SKETCHES = SketchSet(
+    compression=float(os.getenv("PERCENTILE_COMPRESSION", "100"))
+) if PERCENTILES_ENABLED else None
+
+def update_sketches(user_info: UserHealthInfo, values: Tuple[float, ...]):
+    """Add one assessment's SKETCH_METRICS values to the sketches of its age band and gender"""
+    if PERCENTILE_SKETCHES is None:
+        return
+    age_band = get_age_band(user_info.age)
+    for metric, value in zip(SKETCH_METRICS, values):
+        PERCENTILE_SKETCHES.add((age_band, user_info.gender, metric), value)
+
+def update_sketches_columns(records: np.ndarray, metrics: dict):
+    """Add a binary batch to the sketches, one vectorized selection per age band and gender"""
+    if PERCENTILE_SKETCHES is None:
+        return
+    groups = np.searchsorted(AGE_BAND_BOUNDS, records["age"], side="left") * len(GENDERS) + records["gender"]
+    for group in np.unique(groups).tolist():
+        selected = groups == group
+        age_band, gender = divmod(group, len(GENDERS))
+        for metric in SKETCH_METRICS:
+            PERCENTILE_SKETCHES.add_many((age_band, GENDERS[gender], metric), metrics[metric][selected].tolist())
+
+def render_percentiles(user_info: UserHealthInfo, values: Tuple[float, ...]) -> bytes:
+    """The percentile of each SKETCH_METRICS value among assessments of the same age band and gender"""
+    age_band = get_age_band(user_info.age)
+    content = {
+        "age_band": AGE_BAND_LABELS[age_band],
+        "gender": user_info.gender,
+        "sample_size": PERCENTILE_SKETCHES.count((age_band, user_info.gender, SKETCH_METRICS[0]))
+    }
+    for metric, value in zip(SKETCH_METRICS, values):
+        fraction = PERCENTILE_SKETCHES.cdf((age_band, user_info.gender, metric), value)
+        content[metric] = round(fraction * 100, 1) if fraction is not None else None
+    return dump_json(content)
+
+def sketch_key_name(key: tuple) -> str:
+    age_band, gender, metric = key
+    return f"{AGE_BAND_LABELS[age_band]}/{gender}/{metric}"
+
+def parse_sketch_key(name: str) -> tuple:
+    """Inverse of sketch_key_name; raises ValueError for unknown groups or metrics"""
+    age_band, gender, metric = name.split("/")
+    if gender not in GENDERS or metric not in SKETCH_METRICS:
+        raise ValueError(f"Unknown sketch '{name}'")
+    return AGE_BAND_LABELS.index(age_band), gender, metric
+
+# Execution
+# EXECUTION_MODE=threadpool (the default) runs /assess on Starlette's thread pool
+# like any sync endpoint; EXECUTION_MODE=async computes it inline on the event
+# loop, which is cheaper for a single small assessment. Independently, bulk work
+# of at least PROCESS_POOL_MIN_RECORDS records is spread over a pool of
+# PROCESS_POOL_WORKERS processes so it can use more than one core.
+EXECUTION_MODE = os.getenv("EXECUTION_MODE", "threadpool").lower()
+PROCESS_POOL_WORKERS = int(os.getenv("PROCESS_POOL_WORKERS", "0"))
+PROCESS_POOL_MIN_RECORDS = int(os.getenv("PROCESS_POOL_MIN_RECORDS", "2000"))
+PROCESS_POOL_CHUNK_RECORDS = int(os.getenv("PROCESS_POOL_CHUNK_RECORDS", "1000"))
+PROCESS_POOL: Optional[ProcessPoolExecutor] = None
+
+def warm_up_worker(_: int = 0) -> int:
+    """Exercise the assessment path once so a pool worker is ready before real work arrives"""
+    user_info = UserHealthInfo(name="Warm Up", age=30, gender="female", height=170.0, weight=65.0,
+                               activity_level="moderately_active", goal="maintain")
+    render_plans_batch_json([user_info])
+    return os.getpid()
+
+def start_process_pool():
+    global PROCESS_POOL
+    if PROCESS_POOL_WORKERS <= 0 or PROCESS_POOL is not None:
+        return
+    # spawn rather than fork: the server process already runs an event loop and threads
+    PROCESS_POOL = ProcessPoolExecutor(max_workers=PROCESS_POOL_WORKERS,
+                                       mp_context=multiprocessing.get_context("spawn"))
+    list(PROCESS_POOL.map(warm_up_worker, range(PROCESS_POOL_WORKERS)))
+
+def stop_process_pool():
+    global PROCESS_POOL
+    if PROCESS_POOL is not None:
+        PROCESS_POOL.shutdown(wait=True, cancel_futures=True)
+        PROCESS_POOL = None
+
+def render_plans_chunk(records: List[dict]) -> bytes:
+    """Process pool task: render already-validated user records as comma-separated plan JSON"""
+    users = [UserHealthInfo.model_construct(**record) for record in records]
+    return b",".join(render_plans_batch_json(users))
+
+def dump_user_records(users: List[UserHealthInfo]) -> List[dict]:
+    return [user_info.model_dump() for user_info in users]
+
+async def render_plans_body(users: List[UserHealthInfo]) -> bytes:
+    """Render a JSON array of plans, offloading large batches to the process pool"""
+    if PROCESS_POOL is None or len(users) < PROCESS_POOL_MIN_RECORDS:
+        return b"[" + b",".join(await run_in_threadpool(render_plans_batch_json, users)) + b"]"
+    
+    loop = asyncio.get_running_loop()
+    records = await run_in_threadpool(dump_user_records, users)
+    parts = await asyncio.gather(*(
+        loop.run_in_executor(PROCESS_POOL, render_plans_chunk, records[start:start + PROCESS_POOL_CHUNK_RECORDS])
+        for start in range(0, len(records), PROCESS_POOL_CHUNK_RECORDS)
+    ))
+    return b"[" + b",".join(parts) + b"]"
+
+async def run_scoring(lines: List[Tuple[int, Optional[bytes]]], view: str) -> List[bytes]:
+    """Score NDJSON lines on a worker thread, or in the process pool when there are enough of them"""
+    if PROCESS_POOL is not None and len(lines) >= min(PROCESS_POOL_MIN_RECORDS, NDJSON_BATCH_LINES):
+        return await asyncio.get_running_loop().run_in_executor(PROCESS_POOL, score_ndjson_lines, lines, view)
+    return await run_in_threadpool(score_ndjson_lines, lines, view)
+
+def component_metrics():
+    """Result cache and micro-batcher statistics as (name, type, help, value) samples"""
+    cache = RESULT_CACHE.stats()
+    yield "result_cache_entries", "gauge", "Entries in the /assess result cache", cache["entries"]
+    yield "result_cache_hits_total", "counter", "Result cache hits", cache["hits"]
+    yield "result_cache_misses_total", "counter", "Result cache misses", cache["misses"]
+    yield "result_cache_evictions_total", "counter", "Result cache LRU evictions", cache["evictions"]
+    yield "result_cache_expirations_total", "counter", "Result cache TTL expirations", cache["expirations"]
+    if MICRO_BATCHER is not None:
+        batching = MICRO_BATCHER.stats()
+        yield "micro_batch_direct_calls_total", "counter", "Assessments calculated without batching", batching["direct_calls"]
+        yield "micro_batches_total", "counter", "Micro-batches calculated", batching["batches"]
+        yield "micro_batch_items_total", "counter", "Assessments calculated in micro-batches", batching["batched_items"]
+    if HISTORY_STORE is not None:
+        history = HISTORY_STORE.stats()
+        yield "history_queue_depth", "gauge", "Assessments waiting to be written to the history store", history["queued"]
+        yield "history_written_total", "counter", "Assessments written to the history store", history["written"]
+        yield "history_dropped_total", "counter", "Assessments dropped because the history queue was full", history["dropped"]
+        yield "history_write_errors_total", "counter", "Failed history store transactions", history["write_errors"]
+    if PERCENTILE_SKETCHES is not None:
+        sketches = PERCENTILE_SKETCHES.stats()
+        yield "percentile_sketch_centroids", "gauge", "Centroids held by all percentile sketches", sketches["centroids"]
+        yield "percentile_sketch_values_total", "counter", "Values added to percentile sketches", sketches["values"]
+    if COHORT_STORE is not None:
+        cohort = COHORT_STORE.stats()
+        yield "cohort_store_rows", "gauge", "Assessments in the cohort store", cohort["rows"]
+        yield "cohort_store_queue_depth", "gauge", "Appends waiting to be written to the cohort store", cohort["queued"]
+        yield "cohort_store_dropped_total", "counter", "Cohort store appends dropped because the queue was full", cohort["dropped"]
+    if ADMISSION_LIMITER is not None:
+        yield "admission_in_progress", "gauge", "Requests holding an admission slot", ADMISSION_LIMITER.active
+        yield "admission_queue_depth", "gauge", "Requests waiting for an admission slot", ADMISSION_LIMITER.queued
+    if RATE_LIMIT_BUCKETS is not None:
+        yield "rate_limit_clients", "gauge", "Clients with a rate limit token bucket", len(RATE_LIMIT_BUCKETS)
+    if FRAGMENT_COMPRESSOR is not None:
+        compressed = COMPRESSED_RESPONSE_CACHE.stats()
+        yield "compressed_cache_entries", "gauge", "Entries in the compressed /assess response cache", compressed["entries"]
+        yield "compressed_cache_hits_total", "counter", "Compressed response cache hits", compressed["hits"]
+        yield "compressed_fragment_bytes", "gauge", "Uncompressed bytes of pre-compressed response fragments", FRAGMENT_COMPRESSOR.stats()["fragment_bytes"]
+    if PROFILER is not None:
+        yield "profiled_requests_total", "counter", "Requests run under the profiler", PROFILER.stats()["profiles"]
+    yield "live_sessions", "gauge", "Open /assess/live sessions", LIVE_STATS["sessions"]
+    yield "live_updates_total", "counter", "Field updates received by /assess/live sessions", LIVE_STATS["updates"]
+    yield "live_evaluations_total", "counter", "Outputs recalculated for /assess/live updates", LIVE_STATS["evaluations"]
+
+METRICS.add_collector(component_metrics)
+
+# Upper bound on records accepted by a single /assess/batch call
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "50000"))
+
+# Streaming NDJSON Scoring
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+NDJSON_MAX_LINE_BYTES = int(os.getenv("NDJSON_MAX_LINE_BYTES", "65536"))
+NDJSON_BATCH_LINES = int(os.getenv("NDJSON_BATCH_LINES", "1000"))
+
+def ndjson_error(line_no: int, message: str) -> bytes:
+    """Build the NDJSON error record emitted in place of a line that could not be scored"""
+    return dump_json({"line": line_no, "error": message}) + b"\n"
+
+class NDJSONLineSplitter:
+    """Incrementally split a byte stream into numbered NDJSON lines.
+
+    Only the current partial line is buffered, and a line longer than max_line_bytes
+    is dropped (reported as None) instead of growing the buffer without bound.
+    """
+    def __init__(self, max_line_bytes: int = NDJSON_MAX_LINE_BYTES):
+        self.max_line_bytes = max_line_bytes
+        self.buffer = b""
+        self.line_no = 0
+        self.oversized = False
+
+    def _emit(self, raw: bytes, lines: List[Tuple[int, Optional[bytes]]]):
+        self.line_no += 1
+        if self.oversized:
+            lines.append((self.line_no, None))
+            self.oversized = False
+        elif raw.strip():
+            lines.append((self.line_no, raw))
+
+    def feed(self, chunk: bytes) -> List[Tuple[int, Optional[bytes]]]:
+        lines = []
+        data = self.buffer + chunk
+        start = 0
+        while True:
+            end = data.find(b"\n", start)
+            if end == -1:
+                break
+            self._emit(data[start:end], lines)
+            start = end + 1
+        self.buffer = data[start:]
+        if len(self.buffer) > self.max_line_bytes:
+            self.buffer = b""
+            self.oversized = True
+        return lines
+
+    def close(self) -> List[Tuple[int, Optional[bytes]]]:
+        lines = []
+        if self.buffer or self.oversized:
+            self._emit(self.buffer, lines)
+            self.buffer = b""
+        return lines
+
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse whose body iterator may still be reading the request body.
+
+    The stock implementation watches receive() for client disconnects while it
+    streams, which would swallow the request chunks the iterator is consuming.
+    A disconnect surfaces as ClientDisconnect from request.stream() instead.
+    """
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        async for chunk in self.body_iterator:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+def score_ndjson_lines(lines: List[Tuple[int, Optional[bytes]]], view: str = "plan") -> List[bytes]:
+    """Score numbered NDJSON lines, returning exactly one output line per input line.
+
+    Valid records are assessed together through the batch path; invalid ones become
+    error records so a single bad line never fails the rest of the stream.
+    """
+    outputs: List[Optional[bytes]] = [None] * len(lines)
+    users = []
+    positions = []
+    for position, (line_no, raw) in enumerate(lines):
+        if raw is None:
+            outputs[position] = ndjson_error(line_no, f"Line exceeds {NDJSON_MAX_LINE_BYTES} bytes")
+            continue
+        try:
+            users.append(UserHealthInfo.model_validate_json(raw))
+            positions.append(position)
+        except ValidationError as e:
+            message = "; ".join(f"{'.'.join(str(loc) for loc in err['loc']) or 'body'}: {err['msg']}" for err in e.errors())
+            outputs[position] = ndjson_error(line_no, message)
+    
+    if users:
+        try:
+            batch_metrics = list(iter_health_metrics_batch(users))
+        except Exception:
+            # Calculate each record on its own, so only the records that fail are reported
+            batch_metrics = [None] * len(users)
+        for position, user_info, metrics in zip(positions, users, batch_metrics):
+            try:
+                if metrics is None:
+                    metrics = calculate_health_metrics(user_info)
+                assessment = build_assessment_content(user_info, metrics)
+                if view == "assessment":
+                    outputs[position] = dump_json(assessment) + b"\n"
+                else:
+                    outputs[position] = render_plan_json(user_info, assessment) + b"\n"
+            except Exception as e:
+                outputs[position] = ndjson_error(lines[position][0], f"Error processing health assessment: {str(e)}")
+    
+    return outputs
+
+def iter_ndjson_results(chunks: Iterable[bytes], view: str = "plan", batch_lines: int = NDJSON_BATCH_LINES) -> Iterator[bytes]:
+    """Offline generator pipeline: NDJSON input chunks in, NDJSON result lines out, in constant memory"""
+    splitter = NDJSONLineSplitter()
+    pending = []
+    for chunk in chunks:
+        pending.extend(splitter.feed(chunk))
+        while len(pending) >= batch_lines:
+            yield from score_ndjson_lines(pending[:batch_lines], view)
+            del pending[:batch_lines]
+    pending.extend(splitter.close())
+    for start in range(0, len(pending), batch_lines):
+        yield from score_ndjson_lines(pending[start:start + batch_lines], view)
+
+# Binary Ingestion
+# POST /assess/binary takes a body of fixed-width little-endian records instead
+# of JSON. The enumerated fields are sent as their position in GENDERS,
+# ACTIVITY_LEVELS, GOALS and DIETARY_PREFERENCES (0 means no preference), so the
+# body maps straight onto a NumPy structured array without parsing or copying,
+# and the whole cohort is validated with a handful of array comparisons.
+BINARY_MEDIA_TYPE = "application/octet-stream"
+RECORD_DTYPE = np.dtype([
+    ("id", "<u8"),
+    ("height", "<f8"),
+    ("weight", "<f8"),
+    ("age", "u1"),
+    ("gender", "u1"),
+    ("activity_level", "u1"),
+    ("goal", "u1"),
+    ("dietary_preference", "u1"),
+    ("reserved", "V3")
+])
+RESULT_DTYPE = np.dtype([
+    ("id", "<u8"),
+    ("bmi", "<f8"),
+    ("bmr", "<f8"),
+    ("daily_calories", "<f8"),
+    ("protein", "<f8"),
+    ("carbs", "<f8"),
+    ("fats", "<f8"),
+    ("water_liters", "<f8"),
+    ("min_kg", "<f8"),
+    ("max_kg", "<f8"),
+    ("bmi_category", "u1"),
+    ("reserved", "V7")
+])
+# Invalid record indices listed in a 422 response
+MAX_REPORTED_INVALID_RECORDS = 20
+
+def encode_records(users: List[UserHealthInfo], ids: Optional[Iterable[int]] = None) -> bytes:
+    """Pack users into the /assess/binary request format (names and medical conditions are not sent)"""
+    records = np.zeros(len(users), dtype=RECORD_DTYPE)
+    records["id"] = list(ids) if ids is not None else range(len(users))
+    records["height"] = [u.height for u in users]
+    records["weight"] = [u.weight for u in users]
+    records["age"] = [u.age for u in users]
+    records["gender"] = [GENDER_CODES[u.gender] for u in users]
+    records["activity_level"] = [ACTIVITY_LEVEL_CODES[u.activity_level] for u in users]
+    records["goal"] = [GOAL_CODES[u.goal] for u in users]
+    records["dietary_preference"] = [DIETARY_PREFERENCE_CODES[u.dietary_preference] for u in users]
+    return records.tobytes()
+
+def find_invalid_records(records: np.ndarray) -> np.ndarray:
+    """Indices of records breaking the same constraints UserHealthInfo enforces"""
+    invalid = (records["age"] < 1) | (records["age"] > 120)
+    invalid |= records["gender"] >= len(GENDERS)
+    invalid |= records["activity_level"] >= len(ACTIVITY_LEVELS)
+    invalid |= records["goal"] >= len(GOALS)
+    invalid |= records["dietary_preference"] >= len(DIETARY_PREFERENCES)
+    for field in ("height", "weight"):
+        invalid |= ~(np.isfinite(records[field]) & (records[field] > 0))
+    return np.flatnonzero(invalid)
+
+def calculate_record_metrics(records: np.ndarray) -> dict:
+    return calculate_metrics_columns(
+        weight=records["weight"],
+        height=records["height"],
+        age=records["age"],
+        gender=records["gender"],
+        activity_level=records["activity_level"],
+        goal=records["goal"],
+        dietary_preference=records["dietary_preference"]
+    )
+
+def render_records_binary(records: np.ndarray) -> bytes:
+    """Health metrics for every record as packed RESULT_DTYPE rows"""
+    metrics = calculate_record_metrics(records)
+    record_cohort_columns(records, metrics)
+    update_sketches_columns(records, metrics)
+    results = np.zeros(len(records), dtype=RESULT_DTYPE)
+    results["id"] = records["id"]
+    for field in RESULT_DTYPE.names:
+        if field in metrics:
+            results[field] = metrics[field]
+    return results.tobytes()
+
+def render_records_json(records: np.ndarray) -> bytes:
+    """A JSON list of {"id", "assessment"} objects, one HealthAssessment per record"""
+    arrays = calculate_record_metrics(records)
+    record_cohort_columns(records, arrays)
+    update_sketches_columns(records, arrays)
+    metrics = {key: values.tolist() for key, values in arrays.items()}
+    age_bands = np.searchsorted(AGE_BAND_BOUNDS, records["age"], side="left").tolist()
+    ids = records["id"].tolist()
+    goals = records["goal"].tolist()
+    activity_levels = records["activity_level"].tolist()
+    results = []
+    for i, bmi_band in enumerate(metrics["bmi_category"]):
+        min_weight = metrics["min_kg"][i]
+        max_weight = metrics["max_kg"][i]
+        results.append({"id": ids[i], "assessment": {
+            "bmi": metrics["bmi"][i],
+            "bmi_category": BMI_CATEGORIES[bmi_band],
+            "bmr": metrics["bmr"][i],
+            "daily_calories": metrics["daily_calories"][i],
+            "protein_grams": metrics["protein"][i],
+            "carbs_grams": metrics["carbs"][i],
+            "fats_grams": metrics["fats"][i],
+            "water_liters": metrics["water_liters"][i],
+            "ideal_weight_range": {"min_kg": min_weight, "max_kg": max_weight, "range": f"{min_weight}-{max_weight} kg"},
+            "health_risks": RISK_CELLS_OR_NONE[bmi_band * AGE_BAND_COUNT + age_bands[i]],
+            "recommendations": RECOMMENDATION_TABLE[
+                (bmi_band, GOALS[goals[i]], ACTIVITY_LEVELS[activity_levels[i]], age_bands[i])]
+        }})
+    return dump_json(results)
+
+# Goal Trajectories
+# POST /simulate/trajectory projects weight, BMI, BMR and calorie targets week by
+# week for a grid of scenarios. With adaptive targets the calorie target is
+# re-planned from each week's BMR, so the daily energy balance stays at the
+# scenario's adjustment; otherwise the week-0 target is kept while expenditure
+# follows the changing weight. Either way the weight recurrence has a closed
+# form, so the whole scenario-by-week grid is a handful of array operations.
+ENERGY_PER_KG = 7700  # kcal per kg of body weight change
+MIN_PROJECTED_BMI = 12  # Projections never fall below this BMI
+
+def simulate_trajectories(request: TrajectoryRequest, multipliers: np.ndarray, adjustments: np.ndarray) -> dict:
+    """(scenario, week) arrays of weight, bmi, bmr, tdee and daily_calories for weeks 0..request.weeks.
+
+    Scenario i uses activity multiplier multipliers[i] and daily calorie
+    adjustment adjustments[i]. BMI, BMR and calories round exactly like the
+    scalar calculate_* functions.
+    """
+    week = np.arange(request.weeks + 1)
+    multiplier = multipliers[:, None]
+    adjustment = adjustments[:, None]
+    gender_offset = 5.0 if request.gender == "male" else -161.0
+    # The part of the BMR that does not depend on weight
+    constant = 6.25 * request.height - 5 * request.age + gender_offset
+    if request.adaptive_targets:
+        weight = request.weight + adjustment * 7 / ENERGY_PER_KG * week
+    else:
+        # w[n+1] = w[n] + 7 * (intake - multiplier * (10 * w[n] + constant)) / ENERGY_PER_KG,
+        # which moves geometrically towards the weight where intake equals expenditure
+        intake = multiplier * (10 * request.weight + constant) + adjustment
+        balance_weight = (intake - multiplier * constant) / (10 * multiplier)
+        rate = 1 - 70 * multiplier / ENERGY_PER_KG
+        weight = balance_weight + (request.weight - balance_weight) * rate ** week
+    height_m_sq = (request.height / 100) ** 2
+    weight = np.round(np.maximum(weight, MIN_PROJECTED_BMI * height_m_sq), 2)
+    weight[:, 0] = request.weight
+    
+    shape = weight.shape
+    flat_weight = weight.ravel()
+    flat_multiplier = np.broadcast_to(multiplier, shape).ravel()
+    flat_adjustment = np.broadcast_to(adjustment, shape).ravel()
+    bmi = round_like_scalar(flat_weight / height_m_sq, 2,
+                            lambda i: calculate_bmi(float(flat_weight[i]), request.height))
+    bmr = round_like_scalar((10 * flat_weight) + (6.25 * request.height) - (5 * request.age) + gender_offset, 2,
+                            lambda i: calculate_bmr(float(flat_weight[i]), request.height, request.age, request.gender))
+    tdee = round_like_scalar(bmr * flat_multiplier, 2,
+                             lambda i: round(float(bmr[i]) * float(flat_multiplier[i]), 2))
+    if request.adaptive_targets:
+        daily_calories = round_like_scalar((bmr * flat_multiplier) + flat_adjustment, 2,
+                                           lambda i: round(float(bmr[i]) * float(flat_multiplier[i]) + float(flat_adjustment[i]), 2))
+        daily_calories = daily_calories.reshape(shape)
+    else:
+        initial_bmr = bmr.reshape(shape)[:, 0]
+        initial_calories = round_like_scalar((initial_bmr * multipliers) + adjustments, 2,
+                                             lambda i: round(float(initial_bmr[i]) * float(multipliers[i]) + float(adjustments[i]), 2))
+        daily_calories = np.broadcast_to(initial_calories[:, None], shape)
+    return {
+        "weight": weight,
+        "bmi": bmi.reshape(shape),
+        "bmr": bmr.reshape(shape),
+        "tdee": tdee.reshape(shape),
+        "daily_calories": daily_calories
+    }
+
+# Live Assessment
+# The WebSocket at /assess/live keeps one user's form on the server while it is
+# being filled in. Each message sets a few fields; only the outputs that depend
+# on them are recalculated, and only the ones that actually changed are sent
+# back, laid out like the matching parts of an /assess response.
+LIVE_GRAPH = DependencyGraph({
+    "bmi": (("weight", "height"), calculate_bmi),
+    "bmi_category": (("bmi",), get_bmi_category),
+    "bmr": (("weight", "height", "age", "gender"), calculate_bmr),
+    "daily_calories": (("bmr", "activity_level", "goal"), calculate_daily_calories),
+    "macros": (("daily_calories", "goal", "dietary_preference"), calculate_macros),
+    "protein_grams": (("macros",), lambda macros: macros["protein"]),
+    "carbs_grams": (("macros",), lambda macros: macros["carbs"]),
+    "fats_grams": (("macros",), lambda macros: macros["fats"]),
+    "water_liters": (("weight",), lambda weight: round(weight * 0.033, 1)),
+    "ideal_weight_range": (("height", "gender"), calculate_ideal_weight),
+    "health_risks": (("bmi", "age", "medical_conditions"), lookup_health_risks),
+    "recommendations": (("bmi", "goal", "activity_level", "age"), lambda bmi, goal, activity_level, age: lookup_recommendations(
+        _fragment_user(goal=goal, activity_level=activity_level, age=age), bmi)),
+    "workout_plan": (("goal", "activity_level"), lambda goal, activity_level: WORKOUT_PLAN_FRAGMENTS[(goal, activity_level)]),
+    "meal_suggestions": (("daily_calories", "macros", "dietary_preference"), lambda daily_calories, macros, dietary_preference:
+        render_meal_suggestions(_fragment_user(dietary_preference=dietary_preference), daily_calories, macros)),
+    "lifestyle_tips": ((), lambda: LIFESTYLE_TIPS_FRAGMENT),
+    "weekly_goals": (("goal", "daily_calories"), lambda goal, daily_calories: render_weekly_goals(
+        _fragment_user(goal=goal), daily_calories))
+})
+# Optional fields start out at their defaults
+LIVE_DEFAULTS = {name: field.default for name, field in UserHealthInfo.model_fields.items()
+                 if not field.is_required() and name in LIVE_GRAPH.inputs}
+LIVE_ASSESSMENT_FIELDS = tuple(HealthAssessment.model_fields)
+LIVE_PLAN_SECTIONS = ("workout_plan", "meal_suggestions", "lifestyle_tips", "weekly_goals")
+LIVE_STATS = {"sessions": 0, "updates": 0, "evaluations": 0}
+# Live forms are validated field by field as they are typed, so implausible
+# body measurements are rejected before anything is calculated from them
+LIVE_FIELD_BOUNDS = {"height": (30.0, 300.0), "weight": (1.0, 1000.0)}
+
+def parse_live_fields(form: UserHealthInfo, fields: dict) -> Tuple[dict, List[str], dict]:
+    """Validate a live update into (values to set, fields to clear, error message per field).
+
+    Empty values clear a required field and reset an optional one; invalid
+    values, including measurements outside LIVE_FIELD_BOUNDS, are cleared too,
+    so nothing is calculated from them.
+    """
+    changes = {}
+    cleared = []
+    errors = {}
+    for name, value in fields.items():
+        field = UserHealthInfo.model_fields.get(name)
+        if field is None:
+            errors[name] = "Unknown field"
+        elif value is None or value == "":
+            if field.is_required():
+                cleared.append(name)
+            else:
+                changes[name] = None
+        else:
+            try:
+                UserHealthInfo.__pydantic_validator__.validate_assignment(form, name, value)
+            except ValidationError as e:
+                errors[name] = e.errors()[0]["msg"]
+                cleared.append(name)
+                continue
+            value = getattr(form, name)
+            low, high = LIVE_FIELD_BOUNDS.get(name, (None, None))
+            if low is not None and not low <= value <= high:
+                errors[name] = f"Input should be between {low:g} and {high:g}"
+                cleared.append(name)
+            else:
+                changes[name] = value
+    inputs = LIVE_GRAPH.inputs
+    return ({name: value for name, value in changes.items() if name in inputs},
+            [name for name in cleared if name in inputs], errors)
+
+def _live_json(value) -> bytes:
+    if value is None:
+        return b"null"
+    return value if isinstance(value, bytes) else dump_json(value)
+
+def render_live_update(version: int, updates: dict, errors: Optional[dict] = None) -> bytes:
+    """Render changed outputs (None for ones no longer available) as a partial /assess response"""
+    parts = [b'"version":' + str(version).encode()]
+    assessment = [b'"' + name.encode() + b'":' + _live_json(updates[name])
+                  for name in LIVE_ASSESSMENT_FIELDS if name in updates]
+    if assessment:
+        parts.append(b'"assessment":{' + b",".join(assessment) + b"}")
+    for section in LIVE_PLAN_SECTIONS:
+        if section in updates:
+            parts.append(b'"' + section.encode() + b'":' + _live_json(updates[section]))
+    if errors:
+        parts.append(b'"errors":' + dump_json(errors))
+    return b"{" + b",".join(parts) + b"}"
+
+# Profiling
+# Requests to /assess can be run under a profiler, either because they carry
+# the PROFILING_TOKEN in an X-Profile-Token header or because they were picked
+# at random at PROFILING_SAMPLE_RATE. Profiles add up in memory and are read
+# from /admin/profile with the same header. Other requests are not affected.
+# Without a token the profiles could never be read, so nothing is sampled.
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+if PROFILING_SAMPLE_RATE > 0 and not PROFILING_TOKEN:
+    warnings.warn("PROFILING_SAMPLE_RATE is ignored because PROFILING_TOKEN is not set", RuntimeWarning)
+    PROFILING_SAMPLE_RATE = 0.0
+PROFILER = ProfileAggregator(
+    max_stacks=int(os.getenv("PROFILING_MAX_STACKS", "10000"))
+) if PROFILING_TOKEN else None
+
+def profile_token_valid(token: Optional[str]) -> bool:
+    return bool(PROFILING_TOKEN) and token is not None and hmac.compare_digest(token.encode(), PROFILING_TOKEN.encode())
+
+def should_profile(token: Optional[str]) -> bool:
+    """Whether to profile a request sent with this X-Profile-Token header"""
+    if PROFILER is None:
+        return False
+    return profile_token_valid(token) or random.random() < PROFILING_SAMPLE_RATE
+
+def profiled(profile: bool, function: Callable, *args):
+    return PROFILER.run(function, *args) if profile else function(*args)
+
+# Response Encoding
+# /assess responses carry an ETag that is a hash of the body, so identical
+# plans get identical tags in every process, and GET /assess answers a matching
+# If-None-Match with 304. Bodies are compressed for clients that accept it:
+# gzip bodies splice in the workout plans and lifestyle tips deflated once at
+# startup, and whole compressed bodies are also cached by ETag for repeats.
+RESPONSE_COMPRESSION_ENABLED = os.getenv("RESPONSE_COMPRESSION", "true").lower() == "true"
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+ASSESS_MAX_AGE_SECONDS = int(os.getenv("ASSESS_MAX_AGE_SECONDS", "3600"))
+FRAGMENT_COMPRESSOR = FragmentCompressor(
+    level=int(os.getenv("GZIP_LEVEL", "6")),
+    brotli_quality=int(os.getenv("BROTLI_QUALITY", "5"))
+) if RESPONSE_COMPRESSION_ENABLED else None
+COMPRESSED_RESPONSE_CACHE = ResultCache(
+    max_entries=int(os.getenv("COMPRESSED_CACHE_MAX_ENTRIES", "1000")),
+    ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_SECONDS", "300"))
+)
+if FRAGMENT_COMPRESSOR is not None:
+    for fragment in (*WORKOUT_PLAN_FRAGMENTS.values(), LIFESTYLE_TIPS_FRAGMENT):
+        FRAGMENT_COMPRESSOR.register(fragment)
+ASSESS_RESPONSES = METRICS.counter(
+    "assess_responses_total", "/assess responses by content coding, or not_modified for 304s", ("coding",))
+
+def content_etag(body: bytes) -> str:
+    """Strong ETag of a JSON body: a hash of its bytes"""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header lists etag in any of its encodings, compared weakly"""
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    digest = etag.strip('"')
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        value = tag.strip('"')
+        if value == digest or value.rpartition("-")[0] == digest:
+            return True
+    return False
+
+def encoded_response(parts: List[bytes], accept_encoding: Optional[str] = None, if_none_match: Optional[str] = None,
+                     cache_control: Optional[str] = None) -> Response:
+    """A JSON response of the joined parts with its ETag, compressed if the client accepts it.
+
+    With cache_control (only given for GET requests), a matching If-None-Match
+    gets an empty 304 instead.
+    """
+    body = b"".join(parts)
+    etag = content_etag(body)
+    headers = {}
+    if cache_control is not None:
+        headers["Cache-Control"] = cache_control
+    coding = None
+    if FRAGMENT_COMPRESSOR is not None:
+        headers["Vary"] = "Accept-Encoding"
+        if len(body) >= COMPRESSION_MIN_BYTES:
+            coding = FRAGMENT_COMPRESSOR.negotiate(accept_encoding)
+    # Each encoding is a different representation, so it gets its own tag
+    headers["ETag"] = etag if coding is None else f'{etag[:-1]}-{coding}"'
+    if cache_control is not None and etag_matches(if_none_match, etag):
+        ASSESS_RESPONSES.inc("not_modified")
+        return Response(status_code=304, headers=headers)
+    ASSESS_RESPONSES.inc(coding or "identity")
+    if coding is None:
+        return Response(content=body, media_type="application/json", headers=headers)
+    key = (etag, coding)
+    content = COMPRESSED_RESPONSE_CACHE.get(key)
+    if content is None:
+        content = FRAGMENT_COMPRESSOR.encode(coding, parts)
+        COMPRESSED_RESPONSE_CACHE.put(key, content)
+    headers["Content-Encoding"] = coding
+    return Response(content=content, media_type="application/json", headers=headers)
+
 # API Endpoints
 @app.get("/")
 def read_root():
@@ -435,13 +1806,110 @@ def read_root():
         "message": "Health Assessment API",
         "version": "1.0.0",
         "endpoints": {
-            "/assess": "POST - Submit health information for assessment",
+            "/assess": "POST - Submit health information for assessment; GET/HEAD - the same from query parameters, cacheable",
+            "/assess/batch": "POST - Submit a list of health records for bulk assessment",
+            "/assess/stream": "POST - Stream NDJSON health records and receive NDJSON results",
+            "/assess/binary": "POST - Submit packed binary health records for bulk assessment",
+            "/assess/live": "WebSocket - Live assessment updates while a form is filled in",
+            "/users/{user_id}/history": "GET - Paginated assessment history of a user",
+            "/users/{user_id}/trend": "GET - One metric of a user over time",
+            "/simulate/trajectory": "POST - Week-by-week weight, BMI and calorie projections for many scenarios",
+            "/cohort/summary": "GET - Population statistics grouped by age band, BMI category, goal, etc.",
+            "/percentiles/sketches": "GET - Export percentile sketches; POST - Merge exported sketches",
+            "/cache/stats": "GET - Result cache hit/miss/eviction counters",
+            "/admin/profile": "GET - Aggregated /assess profiles (X-Profile-Token required); DELETE - Reset them",
+            "/metrics": "GET - Prometheus metrics",
             "/docs": "GET - API documentation"
         }
     }
 
+def render_assessment(user_info: UserHealthInfo, user_id: Optional[str] = None, percentiles: bool = False) -> List[bytes]:
+    """Render the /assess response body as a list of fragments, answering repeat inputs from the result cache.
+
+    With a user_id and the history store enabled, the assessment is also queued
+    for the user's history. With percentiles, a percentiles section is added
+    after the plan.
+    """
+    key = result_cache_key(user_info)
+    cached = RESULT_CACHE.get(key)
+    if cached is None:
+        timer = StageTimer(ASSESSMENT_STAGE_DURATION)
+        if MICRO_BATCHER is not None:
+            metrics = MICRO_BATCHER.submit(user_info)
+        else:
+            metrics = calculate_health_metrics(user_info)
+        timer.lap("calculation")
+        assessment = build_assessment_content(user_info, metrics)
+        timer.lap("recommendations")
+        tail = render_plan_tail_parts(user_info, assessment, timer)
+        # The sketched values travel with the cached plan so hits can render percentiles.
+        # Only misses update the sketches, so repeat requests do not skew them
+        values = tuple(assessment[metric] for metric in SKETCH_METRICS)
+        update_sketches(user_info, values)
+        RESULT_CACHE.put(key, (tail, values))
+        head = render_plan_head(user_info)
+        timer.lap("user_info_serialization")
+    else:
+        tail, values = cached
+        head = render_plan_head(user_info)
+    record_assessment(user_info, user_id, tail)
+    if percentiles:
+        return [head, *tail[:-1], b',"percentiles":', render_percentiles(user_info, values), b"}"]
+    return [head, *tail]
+
+async def render_assessment_parts(user_info: UserHealthInfo, fields: Optional[str], user_id: Optional[str],
+                                  percentiles: bool, profile_token: Optional[str]) -> List[bytes]:
+    """The JSON parts of an /assess response, shared by its POST and GET forms"""
+    if fields is not None:
+        try:
+            selection = parse_fields(fields)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    if percentiles and (fields is not None or PERCENTILE_SKETCHES is None):
+        detail = ("percentiles cannot be combined with fields" if fields is not None
+                  else "Percentile sketches are not enabled (set PERCENTILES_ENABLED=true)")
+        raise HTTPException(status_code=400, detail=detail)
+    
+    if fields is not None:
+        # Partial plans bypass the result cache and the micro-batcher
+        function, args = render_plan_fields, (user_info, selection)
+        inline = EXECUTION_MODE == "async"
+    else:
+        function, args = render_assessment, (user_info, user_id, percentiles)
+        # The micro-batcher blocks while it collects a batch, so it always needs a worker thread
+        inline = EXECUTION_MODE == "async" and MICRO_BATCHER is None
+    profile = should_profile(profile_token)
+    try:
+        if inline:
+            result = profiled(profile, function, *args)
+        else:
+            result = await run_in_threadpool(profiled, profile, function, *args)
+        return [result] if fields is not None else result
+        
+    except Exception as e:
+        ASSESSMENT_ERRORS.inc("/assess")
+        raise HTTPException(status_code=500, detail=f"Error processing health assessment: {str(e)}")
+
+def parse_query_user_info(request: Request) -> UserHealthInfo:
+    """UserHealthInfo from query parameters; medical_conditions may be repeated"""
+    params = request.query_params
+    data = {name: params[name] for name in UserHealthInfo.model_fields if name in params}
+    if "medical_conditions" in params:
+        data["medical_conditions"] = params.getlist("medical_conditions")
+    try:
+        return UserHealthInfo.model_validate(data)
+    except ValidationError as e:
+        raise RequestValidationError([{**error, "loc": ("query", *error["loc"])} for error in e.errors()])
+
 @app.post("/assess", response_model=PersonalizedPlan)
-def assess_health(user_info: UserHealthInfo):
+async def assess_health(user_info: UserHealthInfo, fields: Optional[str] = Query(
+        None, description="Comma-separated sections or fields to return, e.g. assessment.bmi,weekly_goals"),
+        user_id: Optional[str] = Header(None, alias="X-User-Id", min_length=1, max_length=128,
+                                        description="Record the assessment in this user's history"),
+        percentiles: bool = Query(False, description="Add the user's BMI, BMR and calorie percentiles "
+                                                     "among users of the same age band and gender"),
+        accept_encoding: Optional[str] = Header(None), if_none_match: Optional[str] = Header(None),
+        profile_token: Optional[str] = Header(None, alias="X-Profile-Token", description="Profile this request")):
     """
     Assess user health and generate personalized plan
     
@@ -450,51 +1918,317 @@ def assess_health(user_info: UserHealthInfo):
     - BMR using Mifflin-St Jeor Equation
     - TDEE based on activity levels
     - Macronutrient distribution based on goals
+    
+    Full plans requested with an X-User-Id header are added to that user's
+    history when the history store is enabled.
     """
+    parts = await render_assessment_parts(user_info, fields, user_id, percentiles, profile_token)
+    return encoded_response(parts, accept_encoding, if_none_match)
+
+@app.api_route("/assess", methods=["GET", "HEAD"], response_model=PersonalizedPlan)
+async def assess_health_cacheable(request: Request, fields: Optional[str] = Query(
+        None, description="Comma-separated sections or fields to return, e.g. assessment.bmi,weekly_goals"),
+        percentiles: bool = Query(False, description="Add the user's BMI, BMR and calorie percentiles "
+                                                     "among users of the same age band and gender"),
+        accept_encoding: Optional[str] = Header(None), if_none_match: Optional[str] = Header(None),
+        profile_token: Optional[str] = Header(None, alias="X-Profile-Token", description="Profile this request")):
+    """
+    Cacheable form of POST /assess taking the user's details as query parameters
+    
+    Responses can be stored by the client's own cache, but not by shared ones
+    since they echo the user's health details, and revalidated with If-None-Match.
+    HEAD returns the same headers without the body. Assessments made this way
+    are never recorded in a history.
+    """
+    user_info = parse_query_user_info(request)
+    parts = await render_assessment_parts(user_info, fields, None, percentiles, profile_token)
+    # Percentiles move as the cohort grows, so those responses are revalidated every time
+    cache_control = "private, no-cache" if percentiles else f"private, max-age={ASSESS_MAX_AGE_SECONDS}"
+    return encoded_response(parts, accept_encoding, if_none_match, cache_control)
+
+@app.post("/assess/batch", response_model=List[PersonalizedPlan])
+async def assess_health_batch(users: List[UserHealthInfo]):
+    """
+    Assess a cohort of users in one call
+    
+    Produces exactly the same plans as calling /assess once per user, but
+    computes the health metrics for the whole list as NumPy arrays. Large
+    batches are split across the process pool when one is configured.
+    """
+    if len(users) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large: at most {MAX_BATCH_SIZE} records per request")
+    
     try:
-        # Calculate health metrics
-        bmi = calculate_bmi(user_info.weight, user_info.height)
-        bmi_category = get_bmi_category(bmi)
-        bmr = calculate_bmr(user_info.weight, user_info.height, user_info.age, user_info.gender)
-        daily_calories = calculate_daily_calories(bmr, user_info.activity_level, user_info.goal)
-        macros = calculate_macros(daily_calories, user_info.goal)
-        ideal_weight = calculate_ideal_weight(user_info.height, user_info.gender)
-        water_liters = round(user_info.weight * 0.033, 1)  # 33ml per kg body weight
+        return Response(content=await render_plans_body(users), media_type="application/json")
         
-        # Generate assessment
-        assessment = HealthAssessment(
-            bmi=bmi,
-            bmi_category=bmi_category,
-            bmr=bmr,
-            daily_calories=daily_calories,
-            protein_grams=macros["protein"],
-            carbs_grams=macros["carbs"],
-            fats_grams=macros["fats"],
-            water_liters=water_liters,
-            ideal_weight_range=ideal_weight,
-            health_risks=assess_health_risks(bmi, user_info.age, user_info.medical_conditions),
-            recommendations=generate_recommendations(user_info, bmi, bmi_category)
-        )
-        
-        # Generate personalized plan
-        plan = PersonalizedPlan(
-            user_info=user_info,
-            assessment=assessment,
-            workout_plan=generate_workout_plan(user_info, bmi_category),
-            meal_suggestions=generate_meal_suggestions(daily_calories, macros, user_info.dietary_preference),
-            lifestyle_tips=generate_lifestyle_tips(user_info),
-            weekly_goals=generate_weekly_goals(user_info, daily_calories)
-        )
-        
-        return plan
+    except Exception as e:
+        ASSESSMENT_ERRORS.inc("/assess/batch")
+        raise HTTPException(status_code=500, detail=f"Error processing batch assessment: {str(e)}")
+
+@app.post("/assess/stream")
+async def assess_health_stream(request: Request, view: str = Query("plan", pattern="^(plan|assessment)$")):
+    """
+    Score newline-delimited JSON health records as they arrive
+    
+    Each input line yields one output line, in order: a PersonalizedPlan (or just
+    the HealthAssessment with view=assessment), or an error record of the form
+    {"line": <n>, "error": "<message>"} for lines that cannot be scored.
+    Results are streamed back while the upload is still being read.
+    """
+    async def results():
+        splitter = NDJSONLineSplitter()
+        try:
+            async for chunk in request.stream():
+                lines = splitter.feed(chunk)
+                for start in range(0, len(lines), NDJSON_BATCH_LINES):
+                    yield b"".join(await run_scoring(lines[start:start + NDJSON_BATCH_LINES], view))
+        except ClientDisconnect:
+            return
+        lines = splitter.close()
+        if lines:
+            yield b"".join(await run_scoring(lines, view))
+    
+    return DuplexStreamingResponse(results(), media_type=NDJSON_MEDIA_TYPE)
+
+@app.post("/assess/binary")
+async def assess_health_binary(request: Request, output: str = Query("json", pattern="^(json|binary)$")):
+    """
+    Assess a cohort sent as packed binary records
+    
+    The body is a sequence of RECORD_DTYPE records (32 bytes each). Returns a
+    JSON list of {"id", "assessment"} objects, or with output=binary the health
+    metrics as packed RESULT_DTYPE records (88 bytes each) in the same order.
+    """
+    body = await request.body()
+    if len(body) % RECORD_DTYPE.itemsize:
+        raise HTTPException(status_code=422, detail=f"Body length must be a multiple of {RECORD_DTYPE.itemsize} bytes")
+    records = np.frombuffer(body, dtype=RECORD_DTYPE)
+    if len(records) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large: at most {MAX_BATCH_SIZE} records per request")
+    invalid = find_invalid_records(records)
+    if invalid.size:
+        shown = ", ".join(str(i) for i in invalid[:MAX_REPORTED_INVALID_RECORDS])
+        more = f" and {invalid.size - MAX_REPORTED_INVALID_RECORDS} more" if invalid.size > MAX_REPORTED_INVALID_RECORDS else ""
+        raise HTTPException(status_code=422, detail=f"Invalid records at indices {shown}{more}")
+    
+    try:
+        if output == "binary":
+            return Response(content=await run_in_threadpool(render_records_binary, records), media_type=BINARY_MEDIA_TYPE)
+        return Response(content=await run_in_threadpool(render_records_json, records), media_type="application/json")
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing health assessment: {str(e)}")
+        ASSESSMENT_ERRORS.inc("/assess/binary")
+        raise HTTPException(status_code=500, detail=f"Error processing binary assessment: {str(e)}")
+
+@app.websocket("/assess/live")
+async def assess_health_live(websocket: WebSocket):
+    """
+    Live feedback while a health form is filled in
+
+    Each text message is a JSON object of UserHealthInfo fields to set, e.g.
+    {"weight": 80}. The reply carries an increasing version and only the
+    assessment fields and plan sections that changed (null when they can no
+    longer be calculated), plus an errors object for invalid fields and for
+    outputs that failed to calculate. The first message after connecting is the
+    initial state.
+    """
+    await websocket.accept()
+    form = UserHealthInfo.model_construct()
+    session = IncrementalSession(LIVE_GRAPH, LIVE_DEFAULTS)
+    version = 0
+    LIVE_STATS["sessions"] += 1
+    try:
+        await websocket.send_text(render_live_update(version, session.values).decode())
+        while True:
+            message = await websocket.receive_text()
+            try:
+                fields = json.loads(message)
+            except ValueError:
+                fields = None
+            if not isinstance(fields, dict):
+                await websocket.send_text(dump_json({"version": version, "error": "Expected a JSON object of fields"}).decode())
+                continue
+            changes, cleared, errors = parse_live_fields(form, fields)
+            evaluations = session.evaluations
+            updates = session.update(changes, cleared)
+            errors.update(session.errors)
+            LIVE_STATS["updates"] += 1
+            LIVE_STATS["evaluations"] += session.evaluations - evaluations
+            version += 1
+            await websocket.send_text(render_live_update(version, updates, errors).decode())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        LIVE_STATS["sessions"] -= 1
+
+@app.get("/users/{user_id}/history")
+def user_history(user_id: str, limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+                 before: Optional[int] = Query(None, ge=0, le=HISTORY_MAX_CURSOR,
+                                               description="Cursor: next_before of the previous page"),
+                 caller_id: Optional[str] = Header(None, alias="X-User-Id"),
+                 token: Optional[str] = Header(None, alias="X-History-Token")):
+    """A user's recorded assessments, newest first"""
+    store = require_history_store()
+    require_history_access(user_id, caller_id, token)
+    rows = store.history(user_id, limit, before)
+    return {
+        "user_id": user_id,
+        "items": [
+            {"id": row_id, "recorded_at": datetime.fromtimestamp(recorded_at).isoformat(),
+             "weight": weight, "height": height, "assessment": json.loads(assessment)}
+            for row_id, recorded_at, weight, height, assessment in rows
+        ],
+        "next_before": rows[-1][0] if len(rows) == limit else None
+    }
+
+@app.get("/users/{user_id}/trend")
+def user_trend(user_id: str, metric: str = Query("bmi", pattern=f"^({'|'.join(TREND_METRICS)})$"),
+               since: Optional[datetime] = None, until: Optional[datetime] = None,
+               limit: int = Query(HISTORY_MAX_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+               after: Optional[int] = Query(None, ge=0, le=HISTORY_MAX_CURSOR,
+                                            description="Cursor: next_after of the previous page"),
+               caller_id: Optional[str] = Header(None, alias="X-User-Id"),
+               token: Optional[str] = Header(None, alias="X-History-Token")):
+    """One metric from a user's history as (recorded_at, value) points, oldest first"""
+    store = require_history_store()
+    require_history_access(user_id, caller_id, token)
+    rows = store.trend(user_id, metric, limit, after,
+                       since.timestamp() if since else None, until.timestamp() if until else None)
+    return {
+        "user_id": user_id,
+        "metric": metric,
+        "points": [{"recorded_at": datetime.fromtimestamp(recorded_at).isoformat(), "value": value}
+                   for _, recorded_at, value in rows],
+        "next_after": rows[-1][0] if len(rows) == limit else None
+    }
+
+@app.post("/simulate/trajectory")
+def simulate_trajectory(request: TrajectoryRequest):
+    """
+    Project weight, BMI, BMR and calorie targets week by week
+    
+    Simulates every combination of activity_levels and goals (or
+    calorie_adjustments), defaulting to the request's own activity level and
+    goal, for 12-52 weeks. Returns the week numbers and, per scenario, one
+    series per metric, ready to chart.
+    """
+    if request.goals is not None and request.calorie_adjustments is not None:
+        raise HTTPException(status_code=422, detail="Sweep either goals or calorie_adjustments, not both")
+    activity_levels = request.activity_levels or [request.activity_level]
+    if request.calorie_adjustments is not None:
+        targets = [(None, float(adjustment)) for adjustment in request.calorie_adjustments]
+    else:
+        targets = [(goal, float(GOAL_CALORIE_ADJUSTMENTS.get(goal, 0))) for goal in request.goals or [request.goal]]
+    scenarios = list(itertools.product(activity_levels, targets))
+    trajectories = simulate_trajectories(
+        request,
+        np.array([ACTIVITY_MULTIPLIERS[activity_level] for activity_level, _ in scenarios]),
+        np.array([adjustment for _, (_, adjustment) in scenarios])
+    )
+    series = {name: values.tolist() for name, values in trajectories.items()}
+    return Response(content=dump_json({
+        "weeks": list(range(request.weeks + 1)),
+        "adaptive_targets": request.adaptive_targets,
+        "scenarios": [
+            {"activity_level": activity_level, "goal": goal, "calorie_adjustment": adjustment,
+             **{name: values[i] for name, values in series.items()}}
+            for i, (activity_level, (goal, adjustment)) in enumerate(scenarios)
+        ]
+    }), media_type="application/json")
+
+@app.get("/cohort/summary")
+def cohort_summary(group_by: str = Query("age_band,bmi_category", description=f"Comma-separated, from {', '.join(COHORT_GROUPS)}"),
+                   metrics: str = Query("bmi,daily_calories", description=f"Comma-separated, from {', '.join(COHORT_METRICS)}"),
+                   age_bands: str = Query(",".join(str(bound) for bound in AGE_BAND_BOUNDS),
+                                          description="Comma-separated upper bounds of the age bands")):
+    """
+    Aggregate every assessment in the cohort store
+    
+    Returns the number of assessments and their share of the population per
+    group, with the mean, standard deviation, minimum and maximum of each
+    requested metric. Columns are scanned from memory-mapped files in chunks,
+    so the population does not need to fit in memory.
+    """
+    if COHORT_STORE is None:
+        raise HTTPException(status_code=404, detail="Cohort store is not enabled (set COHORT_STORE_DIR)")
+    group_names = [name.strip() for name in group_by.split(",") if name.strip()]
+    metric_names = [name.strip() for name in metrics.split(",") if name.strip()]
+    unknown = [name for name in group_names if name not in COHORT_GROUPS] + \
+              [name for name in metric_names if name not in COHORT_METRICS]
+    if unknown or len(set(group_names)) != len(group_names):
+        raise HTTPException(status_code=422, detail=f"Unknown or repeated names: {', '.join(unknown) or group_by}")
+    try:
+        bounds = sorted({int(bound) for bound in age_bands.split(",") if bound.strip()})
+    except ValueError:
+        raise HTTPException(status_code=422, detail="age_bands must be comma-separated integers")
+    return summarize_cohort(group_names, metric_names, bounds)
+
+def require_percentile_sketches() -> SketchSet:
+    if PERCENTILE_SKETCHES is None:
+        raise HTTPException(status_code=404, detail="Percentile sketches are not enabled (set PERCENTILES_ENABLED=true)")
+    return PERCENTILE_SKETCHES
+
+@app.get("/percentiles/sketches")
+def export_percentile_sketches():
+    """This process's percentile sketches, keyed by age band, gender and metric (e.g. 41-50/female/bmi)"""
+    sketches = require_percentile_sketches()
+    return {"sketches": {sketch_key_name(key): digest for key, digest in sketches.export().items()}}
+
+@app.post("/percentiles/sketches")
+def merge_percentile_sketches(export: dict):
+    """Merge sketches exported by another server process into this one's"""
+    sketches = require_percentile_sketches()
+    try:
+        digests = {parse_sketch_key(name): TDigest.from_dict(data) for name, data in export["sketches"].items()}
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid sketch export: {e}")
+    sketches.merge(digests)
+    return sketches.stats()
 
 @app.get("/health")
 def health_check():
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/metrics")
+def prometheus_metrics():
+    """Request, error, in-flight and per-stage latency metrics in the Prometheus text format"""
+    return Response(content=METRICS.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Size and hit/miss/eviction counters of the /assess result cache"""
+    return RESULT_CACHE.stats()
+
+def require_profile_token(token: Optional[str]):
+    if PROFILER is None:
+        raise HTTPException(status_code=404, detail="Profiling is not enabled (set PROFILING_TOKEN)")
+    if not profile_token_valid(token):
+        raise HTTPException(status_code=403, detail="A valid X-Profile-Token header is required")
+
+@app.get("/admin/profile")
+def profile_report(output: str = Query("collapsed", alias="format", pattern="^(collapsed|top)$"),
+                   top: int = Query(20, ge=1, le=1000, description="Functions to list with format=top"),
+                   sort: str = Query("self", pattern="^(self|cumulative)$"),
+                   token: Optional[str] = Header(None, alias="X-Profile-Token")):
+    """
+    Profiles of /assess requests collected so far
+    
+    format=collapsed returns collapsed stacks with self time in microseconds,
+    ready for flamegraph tools; format=top returns the functions with the most
+    self or cumulative time.
+    """
+    require_profile_token(token)
+    if output == "collapsed":
+        return Response(content=PROFILER.collapsed(), media_type="text/plain; charset=utf-8")
+    return {**PROFILER.stats(), "functions": PROFILER.top(top, sort)}
+
+@app.delete("/admin/profile")
+def profile_reset(token: Optional[str] = Header(None, alias="X-Profile-Token")):
+    """Discard the profiles collected so far"""
+    require_profile_token(token)
+    PROFILER.reset()
+    return {"status": "reset"}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
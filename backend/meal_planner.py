@@ -0,0 +1,158 @@
+"""
+Macro-aware meal planning over a local food database
+
+Foods are indexed by diet, meal and role (protein, carb or fat source) when
+the planner is built. For a diet and a macronutrient split (the share of
+calories from protein, carbs and fats), every combination of one food per
+role allowed for a meal is solved for the portions that come closest to the
+split and the meal's calories without exceeding a couple of servings of any
+food, and the best few are cached. The fit is solved per 100 kcal, so portions for an actual meal are the
+cached ones scaled by its calories.
+"""
+from itertools import product
+from threading import Lock
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+import json
+
+import numpy as np
+
+MEALS = ("breakfast", "lunch", "dinner", "snacks")
+ROLES = ("protein", "carb", "fat")
+MACRONUTRIENTS = ("protein", "carbs", "fats")
+# kcal per gram of protein, carbs and fats
+MACRO_ENERGY = (4, 4, 9)
+# Portion caps assume a meal of this size and scale with the actual meal
+REFERENCE_MEAL_KCAL = 500
+# Weight of the meal's calories in the fit, relative to each macronutrient
+CALORIE_WEIGHT = 2.0
+
+class Food(NamedTuple):
+    name: str
+    role: str
+    kcal: float
+    protein: float  # grams per 100 g, like carbs and fats
+    carbs: float
+    fats: float
+    serving_g: float
+    meals: Tuple[str, ...]
+    diets: Tuple[str, ...]
+
+class MealCandidate(NamedTuple):
+    foods: Tuple[Food, ...]
+    grams_per_100_kcal: Tuple[float, ...]
+    error: float  # Root mean square relative deviation from the macro and (weighted) calorie targets
+
+def load_foods(path: str) -> List[Food]:
+    with open(path) as f:
+        records = json.load(f)
+    return [Food(**{**record, "meals": tuple(record["meals"]), "diets": tuple(record["diets"])}) for record in records]
+
+class MealPlanner:
+    """Meal suggestions for a diet and macro split, built from foods.
+
+    A diet of None allows every food; any other diet only foods tagged with it.
+    plan() solves each (diet, split) once and caches the result.
+    """
+    def __init__(self, foods: Sequence[Food], suggestions: int = 3, max_servings: float = 2.0,
+                 iterations: int = 100, max_deviation: float = 0.1):
+        self.foods = tuple(foods)
+        self.suggestions = suggestions
+        self.max_servings = max_servings
+        self.max_deviation = max_deviation
+        self.iterations = iterations
+        self.diets = tuple(sorted({diet for food in self.foods for diet in food.diets}))
+        self.index: Dict[Optional[str], Dict[str, Dict[str, List[int]]]] = {
+            diet: {
+                meal: {
+                    role: [i for i, food in enumerate(self.foods)
+                           if food.role == role and meal in food.meals and (diet is None or diet in food.diets)]
+                    for role in ROLES
+                }
+                for meal in MEALS
+            }
+            for diet in (None, *self.diets)
+        }
+        # Grams of protein, carbs and fats per gram of each food
+        self._macros = np.array([[food.protein, food.carbs, food.fats] for food in self.foods]) / 100
+        self._kcal = np.array([food.kcal for food in self.foods], dtype=np.float64) / 100
+        self._servings = np.array([food.serving_g for food in self.foods], dtype=np.float64)
+        self._plans: Dict[tuple, Tuple[Tuple[MealCandidate, ...], ...]] = {}
+        self._lock = Lock()
+
+    def plan(self, diet: Optional[str], split: Tuple[float, float, float]) -> Tuple[Tuple[MealCandidate, ...], ...]:
+        """The cached candidates for each of MEALS, best first"""
+        key = (diet, split)
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = tuple(self._solve_meal(diet, meal, split) for meal in MEALS)
+            with self._lock:
+                plan = self._plans.setdefault(key, plan)
+        return plan
+
+    def _solve_meal(self, diet: Optional[str], meal: str, split: Tuple[float, float, float]) -> Tuple[MealCandidate, ...]:
+        roles = [foods for foods in self.index[diet][meal].values() if foods]
+        if not roles:
+            return ()
+        combinations = np.array(list(product(*roles)))
+        # Grams of each macronutrient per 100 kcal of the meal
+        target = np.array(split) * 100 / np.array(MACRO_ENERGY)
+        # Relative deviations from the macro and calorie targets are linear in the
+        # portions: weights @ grams - targets, with the calorie row scaled by its weight
+        weights = np.concatenate([
+            self._macros[combinations].transpose(0, 2, 1) / target[:, None],
+            CALORIE_WEIGHT * self._kcal[combinations][:, None, :] / 100
+        ], axis=1)
+        targets = np.array([1.0, 1.0, 1.0, CALORIE_WEIGHT])
+        caps = self.max_servings * self._servings[combinations] * 100 / REFERENCE_MEAL_KCAL
+        grams = self._fit_portions(weights, targets, caps)
+        residuals = np.einsum("nmk,nk->nm", weights, grams) - targets
+        errors = np.sqrt(np.mean(residuals ** 2, axis=1))
+        # Combinations that cannot get every target within max_deviation are only
+        # suggested when no combination can
+        feasible = np.max(np.abs(residuals / targets), axis=1) <= self.max_deviation
+        if feasible.any():
+            errors = np.where(feasible, errors, np.inf)
+
+        candidates = []
+        lead_foods = set()
+        for i in np.argsort(errors, kind="stable").tolist():
+            if candidates and not np.isfinite(errors[i]):
+                break
+            lead = combinations[i][0]
+            if lead in lead_foods:
+                continue
+            lead_foods.add(lead)
+            # Drop foods the fit barely uses
+            kept = [(self.foods[food], float(portion)) for food, portion in zip(combinations[i].tolist(), grams[i])
+                    if portion * self.foods[food].kcal >= 200]
+            if kept:
+                foods, portions = zip(*kept)
+                candidates.append(MealCandidate(foods, portions, float(errors[i])))
+            if len(candidates) == self.suggestions:
+                break
+        return tuple(candidates)
+
+    def _fit_portions(self, weights: np.ndarray, targets: np.ndarray, caps: np.ndarray) -> np.ndarray:
+        """Minimize |weights @ grams - targets|^2 with 0 <= grams <= caps for every combination at once (FISTA)"""
+        gram_matrix = np.einsum("nmk,nml->nkl", weights, weights)
+        step = 1 / np.linalg.eigvalsh(gram_matrix)[:, -1:]
+        rhs = np.einsum("nmk,m->nk", weights, targets)
+        grams = np.zeros(caps.shape)
+        momentum = grams
+        t = 1.0
+        for _ in range(self.iterations):
+            gradient = np.einsum("nkl,nl->nk", gram_matrix, momentum) - rhs
+            updated = np.clip(momentum - step * gradient, 0, caps)
+            t_next = (1 + np.sqrt(1 + 4 * t * t)) / 2
+            momentum = updated + ((t - 1) / t_next) * (updated - grams)
+            grams = updated
+            t = t_next
+        return grams
+
+    @staticmethod
+    def portions(candidate: MealCandidate, calories: float) -> Tuple[List[int], List[int]]:
+        """Whole grams of each food for a meal of calories, and the protein, carbs and fats they give"""
+        grams = [max(0, round(portion * calories / 100)) for portion in candidate.grams_per_100_kcal]
+        achieved = [round(sum(gram * getattr(food, nutrient) for gram, food in zip(grams, candidate.foods)) / 100)
+                    for nutrient in MACRONUTRIENTS]
+        return grams, achieved
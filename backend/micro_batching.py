@@ -0,0 +1,122 @@
+"""
+Adaptive micro-batching for concurrent requests
+
+Callers on different threads submit single items; items that arrive within a
+short window are processed together by one vectorized call and each caller
+gets back its own result. When no other caller is active the item is processed
+straight away, so an idle server never pays the batching delay.
+"""
+from threading import Condition, Event
+from typing import Any, Callable, List, Optional
+import time
+
+class _Slot:
+    __slots__ = ("item", "ready", "lead", "done", "result", "error")
+
+    def __init__(self, item: Any):
+        self.item = item
+        self.ready = Event()
+        self.lead = False
+        self.done = False
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+class MicroBatcher:
+    """Group concurrent submit() calls into batches for process_batch.
+
+    process_batch takes a list of items and returns a list of results in the
+    same order; process_one, if given, handles a single item on the direct
+    path and when a failed batch is retried item by item. The first caller of a batch leads it: it waits at most
+    max_wait_seconds (or until max_batch_size items are pending), runs the
+    batch and hands out the results. The extra latency any caller takes on is
+    therefore bounded by max_wait_seconds plus the time to process one batch.
+    """
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]],
+                 process_one: Optional[Callable[[Any], Any]] = None, max_batch_size: int = 64,
+                 max_wait_seconds: float = 0.002):
+        self.process_batch = process_batch
+        self.process_one = process_one or (lambda item: process_batch([item])[0])
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_seconds = max_wait_seconds
+        self._cond = Condition()
+        self._pending: List[_Slot] = []
+        self._active = 0
+        self.direct_calls = 0
+        self.batches = 0
+        self.batched_items = 0
+        self.largest_batch = 0
+
+    def submit(self, item: Any) -> Any:
+        with self._cond:
+            self._active += 1
+            direct = self._active == 1 and not self._pending
+            if direct:
+                self.direct_calls += 1
+            else:
+                slot = _Slot(item)
+                slot.lead = not self._pending
+                self._pending.append(slot)
+                if len(self._pending) >= self.max_batch_size:
+                    self._cond.notify_all()
+        try:
+            if direct:
+                return self.process_one(item)
+            while not slot.done:
+                if slot.lead:
+                    slot.lead = False
+                    self._lead()
+                else:
+                    slot.ready.wait()
+                    slot.ready.clear()
+            if slot.error is not None:
+                raise slot.error
+            return slot.result
+        finally:
+            with self._cond:
+                self._active -= 1
+
+    def _lead(self):
+        deadline = time.monotonic() + self.max_wait_seconds
+        with self._cond:
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            if self._pending:
+                # Hand the overflow to a new leader, which starts its own window
+                self._pending[0].lead = True
+                self._pending[0].ready.set()
+            self.batches += 1
+            self.batched_items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+
+        try:
+            results = self.process_batch([slot.item for slot in batch])
+        except Exception:
+            # Retry one by one so a single bad item only fails its own caller
+            for slot in batch:
+                try:
+                    slot.result = self.process_one(slot.item)
+                except Exception as e:
+                    slot.error = e
+        else:
+            for slot, result in zip(batch, results):
+                slot.result = result
+        for slot in batch:
+            slot.done = True
+            slot.ready.set()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_seconds": self.max_wait_seconds,
+                "pending": len(self._pending),
+                "direct_calls": self.direct_calls,
+                "batches": self.batches,
+                "batched_items": self.batched_items,
+                "largest_batch": self.largest_batch
+            }
@@ -0,0 +1,131 @@
+"""
+On-demand request profiling
+
+A ProfileAggregator runs selected calls under a deterministic profiler
+(sys.setprofile, which only affects the calling thread) and adds the time
+spent in every call stack to totals kept in memory. Totals are read back as
+collapsed stacks, one "caller;callee;... microseconds" line per stack, which
+flamegraph.pl, speedscope and similar tools read directly, or as a table of
+the functions with the most time.
+
+Calls that are not profiled pay nothing: the profiler is only installed for
+the duration of run().
+"""
+from threading import Lock
+from typing import Callable, Dict, List, Tuple
+import os
+import sys
+import time
+
+Stack = Tuple[str, ...]
+
+def _function_label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+def _builtin_label(function) -> str:
+    return "<built-in>:" + getattr(function, "__qualname__", getattr(function, "__name__", repr(function)))
+
+class _Trace:
+    """Self time per call stack and call counts per function for one profiled call"""
+    def __init__(self):
+        self.stacks: Dict[Stack, int] = {}
+        self.calls: Dict[str, int] = {}
+        self._path: List[Stack] = [()]
+        self._last = time.perf_counter_ns()
+
+    def __call__(self, frame, event, arg):
+        now = time.perf_counter_ns()
+        stack = self._path[-1]
+        if stack:
+            self.stacks[stack] = self.stacks.get(stack, 0) + now - self._last
+        if event == "call" or event == "c_call":
+            label = _function_label(frame.f_code) if event == "call" else _builtin_label(arg)
+            self.calls[label] = self.calls.get(label, 0) + 1
+            self._path.append(stack + (label,))
+        elif len(self._path) > 1:
+            # Returns from frames entered before profiling started have nothing to pop
+            self._path.pop()
+        self._last = time.perf_counter_ns()
+
+class ProfileAggregator:
+    """Totals of every profiled call, merged across threads.
+
+    At most max_stacks distinct stacks are kept; time in further new stacks is
+    added to a single "[other]" stack.
+    """
+    def __init__(self, max_stacks: int = 10000):
+        self.max_stacks = max_stacks
+        self.profiles = 0
+        self._stacks: Dict[Stack, int] = {}
+        self._calls: Dict[str, int] = {}
+        self._lock = Lock()
+
+    def run(self, function: Callable, *args):
+        """function(*args), profiled"""
+        trace = _Trace()
+        previous = sys.getprofile()
+        sys.setprofile(trace)
+        try:
+            return function(*args)
+        finally:
+            sys.setprofile(previous)
+            self._merge(trace)
+
+    def _merge(self, trace: _Trace):
+        with self._lock:
+            self.profiles += 1
+            for stack, nanoseconds in trace.stacks.items():
+                # The trailing setprofile call is not part of the profiled function
+                if stack[-1] == "<built-in>:setprofile":
+                    continue
+                if stack not in self._stacks and len(self._stacks) >= self.max_stacks:
+                    stack = ("[other]",)
+                self._stacks[stack] = self._stacks.get(stack, 0) + nanoseconds
+            for label, count in trace.calls.items():
+                self._calls[label] = self._calls.get(label, 0) + count
+
+    def reset(self):
+        with self._lock:
+            self.profiles = 0
+            self._stacks.clear()
+            self._calls.clear()
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format, with self time in microseconds, heaviest first"""
+        with self._lock:
+            stacks = sorted(self._stacks.items(), key=lambda item: item[1], reverse=True)
+        lines = []
+        for stack, nanoseconds in stacks:
+            microseconds = nanoseconds // 1000
+            if microseconds:
+                lines.append(";".join(label.replace(";", ",") for label in stack) + f" {microseconds}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def top(self, n: int = 20, sort: str = "self") -> List[dict]:
+        """The n functions with the most self or cumulative time.
+
+        Cumulative time counts every stack a function appears in once, so
+        recursion is not counted twice.
+        """
+        with self._lock:
+            stacks = list(self._stacks.items())
+            calls = dict(self._calls)
+        self_time: Dict[str, int] = {}
+        cumulative: Dict[str, int] = {}
+        for stack, nanoseconds in stacks:
+            self_time[stack[-1]] = self_time.get(stack[-1], 0) + nanoseconds
+            for label in set(stack):
+                cumulative[label] = cumulative.get(label, 0) + nanoseconds
+        totals = self_time if sort == "self" else cumulative
+        ranked = sorted(cumulative, key=lambda label: totals.get(label, 0), reverse=True)[:n]
+        return [{
+            "function": label,
+            "calls": calls.get(label, 0),
+            "self_ms": round(self_time.get(label, 0) / 1e6, 3),
+            "cumulative_ms": round(cumulative[label] / 1e6, 3)
+        } for label in ranked]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"profiles": self.profiles, "stacks": len(self._stacks),
+                    "total_seconds": sum(self._stacks.values()) / 1e9}
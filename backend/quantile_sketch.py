@@ -0,0 +1,220 @@
+"""
+Mergeable streaming quantile sketches
+
+A merging t-digest: values are buffered and periodically folded into weighted
+centroids, kept small at the tails and larger around the median. The number of
+centroids is set by the compression and grows only logarithmically with the
+number of values, so memory stays bounded.
+
+Digests built separately (for example by different server processes) merge
+into one by combining their centroids.
+
+Lookups do not compress: cdf() reads the centroids and scans the unmerged
+buffer, so only inserts that fill the buffer pay for a compression.
+"""
+from threading import Lock
+from typing import Dict, Hashable, Iterable, List, Optional
+import math
+
+import numpy as np
+
+class TDigest:
+    """Approximate distribution of a stream of values.
+
+    Not thread-safe on its own; SketchSet guards its digests with locks.
+    """
+    def __init__(self, compression: float = 100, buffer_size: int = 500):
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.count = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._buffer: List[float] = []
+        # Interpolation points of the CDF, rebuilt after each compression
+        self._xs = np.empty(0)
+        self._ys = np.empty(0)
+
+    def add(self, value: float):
+        self._buffer.append(value)
+        if len(self._buffer) >= self.buffer_size:
+            self._compress()
+
+    def add_many(self, values: Iterable[float]):
+        self._buffer.extend(values)
+        if len(self._buffer) >= self.buffer_size:
+            self._compress()
+
+    def merge(self, other: "TDigest"):
+        other._compress()
+        self._compress(other.means, other.weights, other.min, other.max)
+
+    def _compress(self, means: Optional[np.ndarray] = None, weights: Optional[np.ndarray] = None,
+                  low: float = math.inf, high: float = -math.inf):
+        if not self._buffer and means is None:
+            return
+        buffered = np.array(self._buffer, dtype=np.float64)
+        self._buffer = []
+        parts = [self.means, buffered] + ([means] if means is not None else [])
+        all_means = np.concatenate(parts)
+        all_weights = np.concatenate([self.weights, np.ones(len(buffered))] + ([weights] if weights is not None else []))
+        if not len(all_means):
+            return
+        order = np.argsort(all_means, kind="stable")
+        all_means = all_means[order].tolist()
+        all_weights = all_weights[order].tolist()
+        total = sum(all_weights)
+        self.min = min(self.min, low, all_means[0])
+        self.max = max(self.max, high, all_means[-1])
+
+        merged_means = []
+        merged_weights = []
+        mean = all_means[0]
+        weight = all_weights[0]
+        cumulative = 0.0
+        for next_mean, next_weight in zip(all_means[1:], all_weights[1:]):
+            q = (cumulative + (weight + next_weight) / 2) / total
+            if weight + next_weight <= 4 * total * q * (1 - q) / self.compression:
+                weight += next_weight
+                mean += (next_mean - mean) * next_weight / weight
+            else:
+                merged_means.append(mean)
+                merged_weights.append(weight)
+                cumulative += weight
+                mean = next_mean
+                weight = next_weight
+        merged_means.append(mean)
+        merged_weights.append(weight)
+
+        self.means = np.array(merged_means)
+        self.weights = np.array(merged_weights)
+        self.count = total
+        centers = np.cumsum(self.weights) - self.weights / 2
+        self._xs = np.concatenate(([self.min], self.means, [self.max]))
+        self._ys = np.concatenate(([0.0], centers, [total]))
+
+    def cdf(self, value: float) -> Optional[float]:
+        """Estimated fraction of values at or below value, or None while the digest is empty"""
+        buffered = sum(1 for item in self._buffer if item <= value)
+        total = self.count + len(self._buffer)
+        if not total:
+            return None
+        if not self.count or value < self.min:
+            below = 0.0
+        elif value >= self.max:
+            below = self.count
+        else:
+            below = float(np.interp(value, self._xs, self._ys))
+        return (below + buffered) / total
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimated value below which a fraction q of the values fall"""
+        self._compress()
+        if not self.count:
+            return None
+        return float(np.interp(q * self.count, self._ys, self._xs))
+
+    def to_dict(self) -> dict:
+        self._compress()
+        return {
+            "compression": self.compression,
+            "count": self.count,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "means": self.means.tolist(),
+            "weights": self.weights.tolist()
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TDigest":
+        """Rebuild a digest from to_dict() output, raising ValueError if it is not a valid digest"""
+        compression = float(data["compression"])
+        if not math.isfinite(compression) or compression <= 0:
+            raise ValueError("compression must be a positive number")
+        digest = cls(compression=compression)
+        means = np.array(data["means"], dtype=np.float64)
+        weights = np.array(data["weights"], dtype=np.float64)
+        if means.ndim != 1 or means.shape != weights.shape:
+            raise ValueError("means and weights must be lists of the same length")
+        if len(means):
+            if not np.isfinite(means).all():
+                raise ValueError("means must be finite")
+            if not (np.isfinite(weights).all() and (weights > 0).all()):
+                raise ValueError("weights must be positive")
+            low, high = float(data["min"]), float(data["max"])
+            if not (math.isfinite(low) and math.isfinite(high) and low <= means.min() and means.max() <= high):
+                raise ValueError("min and max must be finite and bound the means")
+            digest._compress(means, weights, low, high)
+        return digest
+
+class SketchSet:
+    """A TDigest per key, created on first use.
+
+    Each digest is guarded by one of stripes locks chosen by the hash of its
+    key, so requests for different groups rarely wait on each other; a separate
+    lock only serializes creating new digests.
+    """
+    def __init__(self, compression: float = 100, stripes: int = 16):
+        self.compression = compression
+        self._digests: Dict[Hashable, TDigest] = {}
+        self._locks = [Lock() for _ in range(stripes)]
+        self._create_lock = Lock()
+
+    def _lock(self, key: Hashable) -> Lock:
+        return self._locks[hash(key) % len(self._locks)]
+
+    def _digest(self, key: Hashable) -> TDigest:
+        digest = self._digests.get(key)
+        if digest is None:
+            with self._create_lock:
+                digest = self._digests.get(key)
+                if digest is None:
+                    digest = self._digests[key] = TDigest(self.compression)
+        return digest
+
+    def add(self, key: Hashable, value: float):
+        digest = self._digest(key)
+        with self._lock(key):
+            digest.add(value)
+
+    def add_many(self, key: Hashable, values: Iterable[float]):
+        digest = self._digest(key)
+        with self._lock(key):
+            digest.add_many(values)
+
+    def cdf(self, key: Hashable, value: float) -> Optional[float]:
+        digest = self._digests.get(key)
+        if digest is None:
+            return None
+        with self._lock(key):
+            return digest.cdf(value)
+
+    def count(self, key: Hashable) -> int:
+        digest = self._digests.get(key)
+        if digest is None:
+            return 0
+        with self._lock(key):
+            return int(digest.count) + len(digest._buffer)
+
+    def export(self) -> Dict[Hashable, dict]:
+        exported = {}
+        for key, digest in list(self._digests.items()):
+            with self._lock(key):
+                exported[key] = digest.to_dict()
+        return exported
+
+    def merge(self, digests: Dict[Hashable, TDigest]):
+        for key, digest in digests.items():
+            target = self._digest(key)
+            with self._lock(key):
+                target.merge(digest)
+
+    def stats(self) -> dict:
+        sketches = centroids = values = 0
+        for key, digest in list(self._digests.items()):
+            with self._lock(key):
+                sketches += 1
+                centroids += len(digest.means)
+                values += digest.count + len(digest._buffer)
+        return {"sketches": sketches, "centroids": centroids, "values": int(values)}
@@ -0,0 +1,40 @@
+"""
+Offline NDJSON bulk scoring
+
+Reads newline-delimited UserHealthInfo records and writes one NDJSON result per
+line, using the same generator pipeline as POST /assess/stream.
+
+Usage:
+    python score_ndjson.py members.ndjson -o results.ndjson
+    cat members.ndjson | python score_ndjson.py --view assessment > results.ndjson
+"""
+import argparse
+import sys
+
+from main import NDJSON_BATCH_LINES, iter_ndjson_results
+
+def main():
+    parser = argparse.ArgumentParser(description="Score NDJSON health records in constant memory")
+    parser.add_argument("input", nargs="?", default="-", help="Input NDJSON file (default: stdin)")
+    parser.add_argument("-o", "--output", default="-", help="Output NDJSON file (default: stdout)")
+    parser.add_argument("--view", choices=["plan", "assessment"], default="plan",
+                        help="Emit full personalized plans or only the health assessment")
+    parser.add_argument("--batch-lines", type=int, default=NDJSON_BATCH_LINES,
+                        help="Records scored together per vectorized batch")
+    args = parser.parse_args()
+
+    source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    sink = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        # Fixed-size chunks, so an overlong line is cut off by the splitter instead of read whole
+        chunks = iter(lambda: source.read(65536), b"")
+        for result in iter_ndjson_results(chunks, view=args.view, batch_lines=args.batch_lines):
+            sink.write(result)
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+        if sink is not sys.stdout.buffer:
+            sink.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
-import { useState } from 'react'
+import { useEffect, useRef, useState } from 'react'
 import axios from 'axios'
 
 const API_URL = 'http://localhost:8000'
+const LIVE_URL = `${API_URL.replace(/^http/, 'ws')}/assess/live`
 
 function HealthForm({ setResults, loading, setLoading }) {
   const [formData, setFormData] = useState({
@@ -18,6 +19,29 @@ function HealthForm({ setResults, loading, setLoading }) {
 
   const [errors, setErrors] = useState({})
   const [medicalConditionInput, setMedicalConditionInput] = useState('')
+  const [live, setLive] = useState({ assessment: {} })
+  const socketRef = useRef(null)
+  const formDataRef = useRef(formData)
+  formDataRef.current = formData
+
+  // Live estimates: the server recalculates only what a changed field affects
+  useEffect(() => {
+    const socket = new WebSocket(LIVE_URL)
+    socket.onopen = () => socket.send(JSON.stringify(formDataRef.current))
+    socket.onmessage = (event) => {
+      const update = JSON.parse(event.data)
+      setLive(prev => ({ ...prev, ...update, assessment: { ...prev.assessment, ...update.assessment } }))
+    }
+    socketRef.current = socket
+    return () => socket.close()
+  }, [])
+
+  const sendLiveUpdate = (fields) => {
+    const socket = socketRef.current
+    if (socket && socket.readyState === WebSocket.OPEN) {
+      socket.send(JSON.stringify(fields))
+    }
+  }
 
   const handleChange = (e) => {
     const { name, value } = e.target
@@ -25,6 +49,7 @@ function HealthForm({ setResults, loading, setLoading }) {
       ...prev,
       [name]: value
     }))
+    sendLiveUpdate({ [name]: value })
     // Clear error when user starts typing
     if (errors[name]) {
       setErrors(prev => ({
@@ -36,19 +61,23 @@ function HealthForm({ setResults, loading, setLoading }) {
 
   const addMedicalCondition = () => {
     if (medicalConditionInput.trim()) {
+      const medical_conditions = [...formData.medical_conditions, medicalConditionInput.trim()]
       setFormData(prev => ({
         ...prev,
-        medical_conditions: [...prev.medical_conditions, medicalConditionInput.trim()]
+        medical_conditions
       }))
+      sendLiveUpdate({ medical_conditions })
       setMedicalConditionInput('')
     }
   }
 
   const removeMedicalCondition = (index) => {
+    const medical_conditions = formData.medical_conditions.filter((_, i) => i !== index)
     setFormData(prev => ({
       ...prev,
-      medical_conditions: prev.medical_conditions.filter((_, i) => i !== index)
+      medical_conditions
     }))
+    sendLiveUpdate({ medical_conditions })
   }
 
   const validateForm = () => {
@@ -293,6 +322,38 @@ function HealthForm({ setResults, loading, setLoading }) {
         )}
       </div>
 
+      {/* Live Estimates */}
+      {live.assessment.bmi != null && (
+        <div className="grid grid-cols-2 md:grid-cols-4 gap-4 mb-6 p-4 bg-primary-50 rounded-lg text-center">
+          <div>
+            <p className="text-sm text-gray-600">BMI</p>
+            <p className="text-xl font-bold text-gray-900">{live.assessment.bmi}</p>
+            <p className="text-xs text-gray-500">{live.assessment.bmi_category}</p>
+          </div>
+          <div>
+            <p className="text-sm text-gray-600">BMR</p>
+            <p className="text-xl font-bold text-gray-900">{live.assessment.bmr != null ? Math.round(live.assessment.bmr) : '–'}</p>
+            <p className="text-xs text-gray-500">kcal/day</p>
+          </div>
+          <div>
+            <p className="text-sm text-gray-600">Daily Calories</p>
+            <p className="text-xl font-bold text-gray-900">
+              {live.assessment.daily_calories != null ? Math.round(live.assessment.daily_calories) : '–'}
+            </p>
+            <p className="text-xs text-gray-500">kcal/day</p>
+          </div>
+          <div>
+            <p className="text-sm text-gray-600">Macros (P/C/F)</p>
+            <p className="text-xl font-bold text-gray-900">
+              {live.assessment.protein_grams != null
+                ? `${Math.round(live.assessment.protein_grams)}/${Math.round(live.assessment.carbs_grams)}/${Math.round(live.assessment.fats_grams)}`
+                : '–'}
+            </p>
+            <p className="text-xs text-gray-500">grams/day</p>
+          </div>
+        </div>
+      )}
+
       {/* Submit Button */}
       <div className="flex justify-center">
         <button
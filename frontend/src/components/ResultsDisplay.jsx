@@ -359,6 +359,11 @@ function ResultsDisplay({ results }) {
                   ~{meal.calories} kcal
                 </span>
               </div>
+              {meal.macros && (
+                <p className="text-xs text-gray-500 mb-3">
+                  Target: {meal.macros.protein}g protein · {meal.macros.carbs}g carbs · {meal.macros.fats}g fats
+                </p>
+              )}
               <ul className="space-y-2">
                 {meal.suggestions.map((suggestion, idx) => (
                   <li key={idx} className="flex items-start gap-2 text-sm text-gray-700">